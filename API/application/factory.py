@@ -1,8 +1,9 @@
 import asyncio
 from functools import partial
-from typing import Callable, Coroutine, Iterable
+from typing import Any, Callable, Coroutine, Iterable, Sequence
 
 from fastapi import APIRouter, FastAPI
+from starlette.responses import Response
 from starlette.middleware.base import BaseHTTPMiddleware
 
 __all__ = ("create",)
@@ -14,6 +15,9 @@ def create(
     startup_tasks: Iterable[Callable[[], Coroutine]] | None = None,
     shutdown_tasks: Iterable[Callable[[], Coroutine]] | None = None,
     middlewares: Iterable[Callable[[], Coroutine]] | None = None,
+    metrics: Callable[[], str] | None = None,
+    metrics_content_type: str = "text/plain; version=0.0.4; charset=utf-8",
+    metrics_dependencies: Sequence[Any] | None = None,
     **kwargs,
 ) -> FastAPI:
     """The application factory using FastAPI framework.
@@ -30,6 +34,20 @@ def create(
     for router in rest_routers:
         app.include_router(router)
 
+    # Expose the metrics for the internal scraper, outside of the docs and
+    # behind `metrics_dependencies` (e.g. the admin credentials)
+    if metrics:
+        async def get_metrics() -> Response:
+            return Response(content=metrics(), media_type=metrics_content_type)
+
+        app.add_api_route(
+            "/metrics",
+            get_metrics,
+            methods=["GET"],
+            include_in_schema=False,
+            dependencies=list(metrics_dependencies or ()),
+        )
+
     # Define startup tasks that are running asynchronous using FastAPI hook
     if startup_tasks:
         for task in startup_tasks:
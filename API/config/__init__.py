@@ -66,6 +66,127 @@ class MiscSettings:
 class Bitrix:
     token: str
     user_id: str
+    api_url: str = "https://bitrix.qazaqrepublic.com/rest"
+
+    # Connection pool shared by every Bitrix instance of the process
+    connections_limit: int = 20
+    connections_per_host: int = 10
+    keepalive_timeout: float = 60.0
+    dns_cache_ttl: int = 300
+
+    # Timeouts of a single request, in seconds (resume uploads are large)
+    total_timeout: float = 120.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 60.0
+
+    # Accepted candidates sent to Bitrix in one batch request (a contact
+    # and a CRM item each, Bitrix runs at most 50 commands per batch)
+    batch_candidates: int = 10
+
+    # Outbox of accepted candidates: workers draining it, how often an idle
+    # worker looks for due entries, how long a claimed entry is owned by its
+    # worker, and the retries of an entry before it is dead-lettered
+    outbox_workers: int = 2
+    outbox_poll_interval: float = 5.0
+    outbox_lease: float = 300.0
+    outbox_max_attempts: int = 8
+    outbox_retry_base_delay: float = 30.0
+    outbox_retry_max_delay: float = 3600.0
+
+    # Retries (idempotent methods only) and circuit breaker of Bitrix calls
+    retry_attempts: int = 3
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 10.0
+    request_deadline: float = 60.0
+    breaker_failures: int = 5
+    breaker_reset_timeout: float = 30.0
+
+
+@dataclass
+class HeadHunterSettings:
+    """Outbound HTTP settings of the HeadHunter client."""
+
+    api_url: str = "https://api.hh.kz/{method}"
+    token_url: str = "https://hh.ru/oauth/token"
+
+    # Connection pool shared by every HeadHunter instance of the process
+    connections_limit: int = 100
+    connections_per_host: int = 20
+    keepalive_timeout: float = 30.0
+    dns_cache_ttl: int = 300
+
+    # Timeouts of a single request, in seconds
+    total_timeout: float = 60.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 30.0
+
+    # negotiations/response paging: page size (HH allows up to 100) and
+    # how many pages of one vacancy are fetched at the same time
+    per_page: int = 100
+    page_concurrency: int = 5
+
+    # Negotiations discarded at the same time by a bulk discard
+    discard_concurrency: int = 10
+    # Tries of a discard before its negotiation is given up as failed, and
+    # how many unconfirmed discards a run sends again before new responses
+    discard_max_attempts: int = 5
+    discard_retry_limit: int = 200
+
+    # auto_analysis pipeline (fetch -> screen -> discard): workers of the
+    # fetch stage (vacancies scanned at a time) and of the screen stage
+    # (discards use discard_concurrency), capacity of the queues between
+    # stages, and how long a stage may spend on one item (for fetch:
+    # waiting for the next page of a vacancy)
+    analysis_fetch_workers: int = 4
+    analysis_screen_workers: int = 4
+    analysis_queue_size: int = 200
+    analysis_fetch_timeout: float = 300.0
+    analysis_screen_timeout: float = 30.0
+    analysis_discard_timeout: float = 60.0
+
+    # Outbound rate limit shared by all HH calls of the process (requests
+    # per second); it is lowered on 429 and recovers up to rate_limit
+    rate_limit: float = 10.0
+    rate_burst: int = 10
+    rate_min: float = 1.0
+    throttle_retries: int = 3
+
+    # Retries of failed idempotent requests, with jittered exponential
+    # backoff, within request_deadline seconds; after breaker_failures
+    # failures in a row HH calls fail fast for breaker_reset_timeout
+    retry_attempts: int = 3
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 10.0
+    request_deadline: float = 60.0
+    breaker_failures: int = 5
+    breaker_reset_timeout: float = 30.0
+
+    # Downloaded resumes above this size are spooled to a temporary file
+    file_memory_limit: int = 1024 * 1024
+
+    # Resumes already fetched: directory of the PDFs (API/cache/resumes
+    # by default), its size limit and how long an unused PDF is kept
+    resume_cache_dir: typing.Optional[str] = None
+    resume_cache_max_bytes: int = 1024 * 1024 * 1024
+    resume_cache_ttl: float = 30 * 86400.0
+
+    # How long /dictionaries is served from memory before revalidation
+    dictionaries_ttl: float = 3600.0
+
+    # Roles, templates, addresses, managers and areas: age after which a
+    # lookup triggers a background refresh, and the refresh job interval
+    reference_ttl: float = 86400.0
+    reference_refresh_interval: float = 21600.0
+
+
+@dataclass
+class SchedulerSettings:
+    # Seconds between two checks of the leader lock: how long the
+    # scheduled jobs may go without a leader after it died
+    leader_check_interval: float = 15.0
+    # Seconds a run may start late (a busy event loop, a new leader)
+    # instead of being skipped
+    misfire_grace_time: int = 300
 
 
 @dataclass
@@ -80,6 +201,8 @@ class Settings:
     misc: MiscSettings
     tg_bot: TgbotSettings
     bitrix: Bitrix
+    hh: HeadHunterSettings
+    scheduler: SchedulerSettings
 
     # Application configuration
     logging: LoggingSettings = LoggingSettings()
@@ -111,7 +234,77 @@ settings = Settings(
     ),
     bitrix=Bitrix(
         token=env.str('BITRIX_TOKEN'),
-        user_id=env.str('BITRIX_USER_ID')
+        user_id=env.str('BITRIX_USER_ID'),
+        api_url=env.str('BITRIX_API_URL', Bitrix.api_url),
+        connections_limit=env.int('BITRIX_CONNECTIONS_LIMIT', Bitrix.connections_limit),
+        connections_per_host=env.int('BITRIX_CONNECTIONS_PER_HOST', Bitrix.connections_per_host),
+        keepalive_timeout=env.float('BITRIX_KEEPALIVE_TIMEOUT', Bitrix.keepalive_timeout),
+        dns_cache_ttl=env.int('BITRIX_DNS_CACHE_TTL', Bitrix.dns_cache_ttl),
+        total_timeout=env.float('BITRIX_TOTAL_TIMEOUT', Bitrix.total_timeout),
+        connect_timeout=env.float('BITRIX_CONNECT_TIMEOUT', Bitrix.connect_timeout),
+        read_timeout=env.float('BITRIX_READ_TIMEOUT', Bitrix.read_timeout),
+        batch_candidates=env.int('BITRIX_BATCH_CANDIDATES', Bitrix.batch_candidates),
+        outbox_workers=env.int('BITRIX_OUTBOX_WORKERS', Bitrix.outbox_workers),
+        outbox_poll_interval=env.float('BITRIX_OUTBOX_POLL_INTERVAL', Bitrix.outbox_poll_interval),
+        outbox_lease=env.float('BITRIX_OUTBOX_LEASE', Bitrix.outbox_lease),
+        outbox_max_attempts=env.int('BITRIX_OUTBOX_MAX_ATTEMPTS', Bitrix.outbox_max_attempts),
+        outbox_retry_base_delay=env.float('BITRIX_OUTBOX_RETRY_BASE_DELAY', Bitrix.outbox_retry_base_delay),
+        outbox_retry_max_delay=env.float('BITRIX_OUTBOX_RETRY_MAX_DELAY', Bitrix.outbox_retry_max_delay),
+        retry_attempts=env.int('BITRIX_RETRY_ATTEMPTS', Bitrix.retry_attempts),
+        retry_base_delay=env.float('BITRIX_RETRY_BASE_DELAY', Bitrix.retry_base_delay),
+        retry_max_delay=env.float('BITRIX_RETRY_MAX_DELAY', Bitrix.retry_max_delay),
+        request_deadline=env.float('BITRIX_REQUEST_DEADLINE', Bitrix.request_deadline),
+        breaker_failures=env.int('BITRIX_BREAKER_FAILURES', Bitrix.breaker_failures),
+        breaker_reset_timeout=env.float('BITRIX_BREAKER_RESET_TIMEOUT', Bitrix.breaker_reset_timeout),
+    ),
+    hh=HeadHunterSettings(
+        api_url=env.str('HH_API_URL', HeadHunterSettings.api_url),
+        token_url=env.str('HH_TOKEN_URL', HeadHunterSettings.token_url),
+        connections_limit=env.int('HH_CONNECTIONS_LIMIT', HeadHunterSettings.connections_limit),
+        connections_per_host=env.int('HH_CONNECTIONS_PER_HOST', HeadHunterSettings.connections_per_host),
+        keepalive_timeout=env.float('HH_KEEPALIVE_TIMEOUT', HeadHunterSettings.keepalive_timeout),
+        dns_cache_ttl=env.int('HH_DNS_CACHE_TTL', HeadHunterSettings.dns_cache_ttl),
+        total_timeout=env.float('HH_TOTAL_TIMEOUT', HeadHunterSettings.total_timeout),
+        connect_timeout=env.float('HH_CONNECT_TIMEOUT', HeadHunterSettings.connect_timeout),
+        read_timeout=env.float('HH_READ_TIMEOUT', HeadHunterSettings.read_timeout),
+        per_page=env.int('HH_PER_PAGE', HeadHunterSettings.per_page),
+        page_concurrency=env.int('HH_PAGE_CONCURRENCY', HeadHunterSettings.page_concurrency),
+        discard_concurrency=env.int('HH_DISCARD_CONCURRENCY', HeadHunterSettings.discard_concurrency),
+        discard_max_attempts=env.int('HH_DISCARD_MAX_ATTEMPTS', HeadHunterSettings.discard_max_attempts),
+        discard_retry_limit=env.int('HH_DISCARD_RETRY_LIMIT', HeadHunterSettings.discard_retry_limit),
+        analysis_fetch_workers=env.int('HH_ANALYSIS_FETCH_WORKERS', HeadHunterSettings.analysis_fetch_workers),
+        analysis_screen_workers=env.int('HH_ANALYSIS_SCREEN_WORKERS', HeadHunterSettings.analysis_screen_workers),
+        analysis_queue_size=env.int('HH_ANALYSIS_QUEUE_SIZE', HeadHunterSettings.analysis_queue_size),
+        analysis_fetch_timeout=env.float('HH_ANALYSIS_FETCH_TIMEOUT', HeadHunterSettings.analysis_fetch_timeout),
+        analysis_screen_timeout=env.float('HH_ANALYSIS_SCREEN_TIMEOUT', HeadHunterSettings.analysis_screen_timeout),
+        analysis_discard_timeout=env.float(
+            'HH_ANALYSIS_DISCARD_TIMEOUT', HeadHunterSettings.analysis_discard_timeout
+        ),
+        rate_limit=env.float('HH_RATE_LIMIT', HeadHunterSettings.rate_limit),
+        rate_burst=env.int('HH_RATE_BURST', HeadHunterSettings.rate_burst),
+        rate_min=env.float('HH_RATE_MIN', HeadHunterSettings.rate_min),
+        throttle_retries=env.int('HH_THROTTLE_RETRIES', HeadHunterSettings.throttle_retries),
+        retry_attempts=env.int('HH_RETRY_ATTEMPTS', HeadHunterSettings.retry_attempts),
+        retry_base_delay=env.float('HH_RETRY_BASE_DELAY', HeadHunterSettings.retry_base_delay),
+        retry_max_delay=env.float('HH_RETRY_MAX_DELAY', HeadHunterSettings.retry_max_delay),
+        request_deadline=env.float('HH_REQUEST_DEADLINE', HeadHunterSettings.request_deadline),
+        breaker_failures=env.int('HH_BREAKER_FAILURES', HeadHunterSettings.breaker_failures),
+        breaker_reset_timeout=env.float('HH_BREAKER_RESET_TIMEOUT', HeadHunterSettings.breaker_reset_timeout),
+        file_memory_limit=env.int('HH_FILE_MEMORY_LIMIT', HeadHunterSettings.file_memory_limit),
+        resume_cache_dir=env.str('HH_RESUME_CACHE_DIR', str(ROOT_PATH / 'cache' / 'resumes')),
+        resume_cache_max_bytes=env.int('HH_RESUME_CACHE_MAX_BYTES', HeadHunterSettings.resume_cache_max_bytes),
+        resume_cache_ttl=env.float('HH_RESUME_CACHE_TTL', HeadHunterSettings.resume_cache_ttl),
+        dictionaries_ttl=env.float('HH_DICTIONARIES_TTL', HeadHunterSettings.dictionaries_ttl),
+        reference_ttl=env.float('HH_REFERENCE_TTL', HeadHunterSettings.reference_ttl),
+        reference_refresh_interval=env.float(
+            'HH_REFERENCE_REFRESH_INTERVAL', HeadHunterSettings.reference_refresh_interval
+        ),
+    ),
+    scheduler=SchedulerSettings(
+        leader_check_interval=env.float(
+            'SCHEDULER_LEADER_CHECK_INTERVAL', SchedulerSettings.leader_check_interval
+        ),
+        misfire_grace_time=env.int('SCHEDULER_MISFIRE_GRACE_TIME', SchedulerSettings.misfire_grace_time),
     )
 )
 
@@ -1 +1 @@
-
+from .upgrade import *
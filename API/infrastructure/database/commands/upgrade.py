@@ -0,0 +1,36 @@
+"""
+Idempotent schema changes for tables that already exist in deployed
+databases. `Base.metadata.create_all` only creates missing tables, so new
+columns and constraints of existing tables are added here.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+__all__ = ("UPGRADE_STATEMENTS", "upgrade_schema", )
+
+UPGRADE_STATEMENTS = (
+    "ALTER TABLE tokens ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP WITHOUT TIME ZONE",
+    "ALTER TABLE tokens ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE vacancies ADD COLUMN IF NOT EXISTS responses_seen_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE negotiations ADD COLUMN IF NOT EXISTS discard_attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE negotiations ADD COLUMN IF NOT EXISTS last_error TEXT",
+    # Resumes recorded twice for a vacancy are merged before the unique index
+    # is built; skipped once the index exists
+    """
+    DO $$
+    BEGIN
+        IF to_regclass('uq_resumes_vacancy_resume') IS NULL THEN
+            DELETE FROM resumes a USING resumes b
+            WHERE a.vacancies_id = b.vacancies_id AND a.resume_id = b.resume_id AND a.id > b.id;
+            CREATE UNIQUE INDEX uq_resumes_vacancy_resume ON resumes (vacancies_id, resume_id);
+        END IF;
+    END $$
+    """,
+)
+
+
+async def upgrade_schema(
+        conn: AsyncConnection
+):
+    for statement in UPGRADE_STATEMENTS:
+        await conn.execute(text(statement))
@@ -0,0 +1,92 @@
+from API.infrastructure.database.models import Base
+
+import datetime
+import typing
+from sqlalchemy import (BigInteger, Column, String, select, DateTime, func, Integer,
+                        desc, Text, JSON, Float, Index)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class JobRuns(Base):
+    """One run of a scheduled job and what it did."""
+    __tablename__ = 'job_runs'
+    __table_args__ = (
+        Index('ix_job_runs_job_started_at', 'job', 'started_at'),
+    )
+
+    ok = 'ok'
+    failed = 'failed'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    job = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    started_at: Column[datetime.datetime] = Column(DateTime(timezone=True), nullable=False)
+    finished_at: Column[datetime.datetime] = Column(DateTime(timezone=True), nullable=False)
+    duration = Column(Float, nullable=False)
+    # Stage -> {'seconds', 'items', 'errors'}; seconds summed over the workers
+    stages = Column(JSON, nullable=True)
+    items_scanned = Column(Integer, nullable=False, default=0)
+    items_changed = Column(Integer, nullable=False, default=0)
+    # Client (hh, bitrix) -> requests sent
+    http_calls = Column(JSON, nullable=True)
+    errors = Column(Integer, nullable=False, default=0)
+    # Exception the run ended with
+    error = Column(Text, nullable=True)
+    # Peak resident memory of the process during the run, bytes
+    peak_memory = Column(BigInteger, nullable=True)
+
+    @classmethod
+    async def get_recent(
+            cls,
+            session: AsyncSession,
+            job: typing.Optional[str] = None,
+            limit: int = 50
+    ) -> typing.Sequence['JobRuns']:
+        stmt = select(JobRuns).order_by(desc(JobRuns.started_at)).limit(limit)
+        if job is not None:
+            stmt = stmt.where(JobRuns.job == job)
+        response = await session.execute(stmt)
+
+        return response.scalars().all()
+
+    @classmethod
+    async def get_percentiles(
+            cls,
+            session: AsyncSession,
+            since: datetime.datetime,
+            job: typing.Optional[str] = None
+    ) -> typing.Dict[str, dict]:
+        """Runs since `since` and p50/p90/p99 of their figures, by job."""
+        columns = {
+            'duration': JobRuns.duration,
+            'items_scanned': JobRuns.items_scanned,
+            'items_changed': JobRuns.items_changed,
+            'peak_memory': JobRuns.peak_memory,
+        }
+        quantiles = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+        stmt = select(
+            JobRuns.job,
+            func.count(),
+            func.count().filter(JobRuns.status == cls.failed),
+            *(
+                func.percentile_cont(q).within_group(column)
+                for column in columns.values()
+                for q in quantiles.values()
+            )
+        ).where(JobRuns.started_at >= since).group_by(JobRuns.job)
+        if job is not None:
+            stmt = stmt.where(JobRuns.job == job)
+        response = await session.execute(stmt)
+
+        result = {}
+        for row in response.all():
+            values = iter(row[3:])
+            result[row[0]] = {
+                'runs': row[1],
+                'failed': row[2],
+                **{
+                    name: {label: next(values) for label in quantiles}
+                    for name in columns
+                }
+            }
+        return result
@@ -6,7 +6,9 @@ import datetime
 import typing
 from sqlalchemy import (BigInteger, Column, String, select, Date,
                         DateTime, func, Integer, ForeignKey, Boolean, update,
-                        desc, not_, VARCHAR, Text, CHAR, JSON, DECIMAL, FLOAT, DOUBLE)
+                        desc, not_, VARCHAR, Text, CHAR, JSON, DECIMAL, FLOAT, DOUBLE, Index,
+                        UniqueConstraint, case)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 
@@ -21,6 +23,8 @@ class Vacancies(Base):
     salary = Column(FLOAT)
     deal_id = Column(String)
     is_active = Column(Boolean, default=False)
+    # HH `created_at` of the newest response handled by auto_analysis
+    responses_seen_at: Column[datetime.datetime] = Column(DateTime(timezone=True), nullable=True)
 
     @classmethod
     async def get_vacancies_by_id(
@@ -52,24 +56,42 @@ class Vacancies(Base):
 
         return await session.scalar(stmt)
 
+    @classmethod
+    async def set_responses_seen_at(
+            cls,
+            session: AsyncSession,
+            draft_id: str,
+            seen_at: datetime.datetime
+    ):
+        stmt = update(Vacancies).where(Vacancies.id == draft_id).values(responses_seen_at=seen_at)
+        await session.execute(stmt)
+
 
 class Token(Base):
     __tablename__ = "tokens"
     id = Column(BigInteger, primary_key=True)
     access_token = Column(String)
     refresh_token = Column(String)
+    expires_at: Column[datetime.datetime] = Column(DateTime, nullable=True)
+    version = Column(Integer, nullable=False, default=0, server_default='0')
 
     @classmethod
     async def get_token(
             cls,
-            session: AsyncSession
-    ):
-        stmt = select(Token)
+            session: AsyncSession,
+            for_update: bool = False
+    ) -> typing.Optional['Token']:
+        stmt = select(Token).order_by(Token.id).limit(1)
+        if for_update:
+            stmt = stmt.with_for_update()
         return await session.scalar(stmt)
 
 
 class Resumes(Base):
     __tablename__ = 'resumes'
+    __table_args__ = (
+        UniqueConstraint('vacancies_id', 'resume_id', name='uq_resumes_vacancy_resume'),
+    )
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     resume_id = Column(String)
     vacancies_id = Column(
@@ -89,3 +111,251 @@ class Resumes(Base):
             (Resumes.vacancies_id == vacancies_id))
 
         return await session.scalar(stmt)
+
+    @classmethod
+    async def insert_new(
+            cls,
+            session: AsyncSession,
+            vacancies_id: str,
+            resume_ids: typing.Iterable[str]
+    ) -> typing.Set[str]:
+        """Add the rows in one statement, return the ids that were not there yet."""
+        rows = [{'resume_id': resume_id, 'vacancies_id': vacancies_id} for resume_id in resume_ids]
+        if not rows:
+            return set()
+        stmt = insert(Resumes).values(rows).on_conflict_do_nothing(
+            index_elements=[Resumes.vacancies_id, Resumes.resume_id]
+        ).returning(Resumes.resume_id)
+        response = await session.scalars(stmt)
+
+        return set(response.all())
+
+
+class Negotiations(Base):
+    """Negotiations (responses) already handled by auto_analysis."""
+    __tablename__ = 'negotiations'
+    __table_args__ = (
+        Index('ix_negotiations_vacancy_state', 'vacancies_id', 'state'),
+    )
+
+    accepted = 'accepted'
+    # Rejected, the discard is not confirmed by HH yet
+    rejected = 'rejected'
+    discarded = 'discarded'
+    # HH refused the discard, or it failed discard_max_attempts times
+    failed = 'failed'
+
+    id = Column(String, primary_key=True)
+    vacancies_id = Column(
+        String,
+        ForeignKey("vacancies.id", onupdate="CASCADE", ondelete="CASCADE")
+    )
+    resume_id = Column(String)
+    # For the discard letter
+    first_name = Column(String, nullable=True)
+    state = Column(String, nullable=False)
+    created_at: Column[datetime.datetime] = Column(DateTime(timezone=True), nullable=True)
+    processed_at: Column[datetime.datetime] = Column(DateTime, server_default=func.now())
+    discard_attempts = Column(Integer, nullable=False, default=0, server_default='0')
+    last_error = Column(Text, nullable=True)
+
+    @classmethod
+    async def insert_new(
+            cls,
+            session: AsyncSession,
+            rows: typing.List[dict]
+    ) -> typing.Set[str]:
+        """Add the rows in one statement, return the ids that were not there yet."""
+        if not rows:
+            return set()
+        stmt = insert(Negotiations).values(rows).on_conflict_do_nothing(
+            index_elements=[Negotiations.id]
+        ).returning(Negotiations.id)
+        response = await session.scalars(stmt)
+
+        return set(response.all())
+
+    @classmethod
+    async def get_rejected(
+            cls,
+            session: AsyncSession,
+            limit: int = 200
+    ) -> typing.Sequence['Negotiations']:
+        stmt = select(Negotiations).where(Negotiations.state == cls.rejected).order_by(
+            Negotiations.created_at
+        ).limit(limit)
+        response = await session.execute(stmt)
+
+        return response.scalars().all()
+
+    @classmethod
+    async def set_state(
+            cls,
+            session: AsyncSession,
+            ids: typing.Collection[str],
+            state: str
+    ):
+        if not ids:
+            return
+        stmt = update(Negotiations).where(Negotiations.id.in_(ids)).values(state=state)
+        await session.execute(stmt)
+
+    @classmethod
+    async def record_discard_failure(
+            cls,
+            session: AsyncSession,
+            negotiation_id: str,
+            error: typing.Optional[str],
+            refused: bool,
+            max_attempts: int
+    ):
+        """Count a failed discard; a refused or exhausted one is not tried again."""
+        attempts = Negotiations.discard_attempts + 1
+        stmt = update(Negotiations).where(
+            Negotiations.id == negotiation_id,
+            Negotiations.state == cls.rejected
+        ).values(
+            discard_attempts=attempts,
+            last_error=error,
+            state=cls.failed if refused else case((attempts >= max_attempts, cls.failed), else_=cls.rejected)
+        )
+        await session.execute(stmt)
+
+
+class ResumeCache(Base):
+    __tablename__ = 'resume_cache'
+    resume_id = Column(String, primary_key=True)
+    updated_at = Column(String, nullable=True)
+    contacts = Column(JSON, nullable=True)
+    pdf_hash = Column(String, nullable=True)
+    pdf_size = Column(BigInteger, nullable=True)
+    bitrix_contact_id = Column(String, nullable=True)
+    fetched_at: Column[datetime.datetime] = Column(DateTime, server_default=func.now())
+
+    @classmethod
+    async def get(
+            cls,
+            session: AsyncSession,
+            resume_id: str
+    ) -> typing.Optional['ResumeCache']:
+        return await session.get(ResumeCache, resume_id)
+
+
+class BitrixOutbox(Base):
+    """Accepted candidates waiting to be sent to Bitrix.
+
+    An entry is added in the transaction of the `Resumes` row and removed
+    once Bitrix has the candidate; the ones that keep failing stay here as
+    dead letters.
+    """
+    __tablename__ = 'bitrix_outbox'
+    __table_args__ = (
+        Index('ix_bitrix_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+    pending = 'pending'
+    processing = 'processing'
+    dead = 'dead'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    negotiation_id = Column(String, nullable=False)
+    vacancies_id = Column(
+        String,
+        ForeignKey("vacancies.id", onupdate="CASCADE", ondelete="CASCADE")
+    )
+    # Resume and vacancy fields the CRM item is built from
+    payload = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default=pending, server_default=pending)
+    attempts = Column(Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at: Column[datetime.datetime] = Column(DateTime, nullable=False, default=datetime.datetime.now)
+    # End of the lease of the worker processing the entry
+    locked_until: Column[datetime.datetime] = Column(DateTime, nullable=True)
+    # Contact created by an earlier attempt, reused by the next ones
+    bitrix_contact_id = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at: Column[datetime.datetime] = Column(DateTime, server_default=func.now())
+
+    @classmethod
+    async def claim(
+            cls,
+            session: AsyncSession,
+            limit: int,
+            lease: float
+    ) -> typing.Sequence['BitrixOutbox']:
+        """Take up to `limit` due entries for `lease` seconds.
+
+        Entries locked by another transaction are skipped, so concurrent
+        workers never claim the same entry. An entry whose lease expired
+        (its worker died) is due again.
+        """
+        now = datetime.datetime.now()
+        due = select(BitrixOutbox.id).where(
+            ((BitrixOutbox.status == cls.pending) & (BitrixOutbox.next_attempt_at <= now)) |
+            ((BitrixOutbox.status == cls.processing) & (BitrixOutbox.locked_until < now))
+        ).order_by(BitrixOutbox.next_attempt_at).limit(limit).with_for_update(skip_locked=True)
+        stmt = update(BitrixOutbox).where(BitrixOutbox.id.in_(due)).values(
+            status=cls.processing,
+            locked_until=now + datetime.timedelta(seconds=lease),
+            attempts=BitrixOutbox.attempts + 1
+        ).returning(BitrixOutbox)
+        response = await session.scalars(stmt, execution_options={'synchronize_session': False})
+
+        return response.all()
+
+    @classmethod
+    async def count_by_status(
+            cls,
+            session: AsyncSession
+    ) -> typing.Dict[str, int]:
+        stmt = select(BitrixOutbox.status, func.count()).group_by(BitrixOutbox.status)
+        response = await session.execute(stmt)
+
+        return {row[0]: row[1] for row in response.all()}
+
+    @classmethod
+    async def get_dead(
+            cls,
+            session: AsyncSession,
+            limit: int = 100
+    ) -> typing.Sequence['BitrixOutbox']:
+        stmt = select(BitrixOutbox).where(BitrixOutbox.status == cls.dead).order_by(
+            desc(BitrixOutbox.id)
+        ).limit(limit)
+        response = await session.execute(stmt)
+
+        return response.scalars().all()
+
+    @classmethod
+    async def requeue(
+            cls,
+            session: AsyncSession,
+            entry_id: int
+    ) -> bool:
+        """Give a dead letter a new round of attempts."""
+        stmt = update(BitrixOutbox).where(
+            (BitrixOutbox.id == entry_id) & (BitrixOutbox.status == cls.dead)
+        ).values(
+            status=cls.pending,
+            attempts=0,
+            next_attempt_at=datetime.datetime.now()
+        )
+        response = await session.execute(stmt)
+
+        return response.rowcount > 0
+
+
+class ReferenceSnapshots(Base):
+    __tablename__ = 'reference_snapshots'
+    name = Column(String, primary_key=True)
+    payload = Column(JSON)
+    fetched_at: Column[datetime.datetime] = Column(DateTime)
+
+    @classmethod
+    async def get_all(
+            cls,
+            session: AsyncSession
+    ) -> typing.Sequence['ReferenceSnapshots']:
+        stmt = select(ReferenceSnapshots)
+        response = await session.execute(stmt)
+
+        return response.scalars().all()
@@ -35,3 +35,13 @@ class ModelDiscard(BaseModel):
     resume_id: typing.Optional[str] = None
     vacancy_id: typing.Optional[str] = None
     name: typing.Optional[str] = None
+
+
+class ModelDiscardItem(BaseModel):
+    resume_id: str
+    name: typing.Optional[str] = None
+
+
+class ModelDiscardBulk(BaseModel):
+    vacancy_id: typing.Optional[str] = None
+    items: typing.List[ModelDiscardItem] = []
@@ -0,0 +1,322 @@
+import asyncio
+import datetime
+import logging
+import random
+import re
+import typing
+from dataclasses import dataclass
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from API import config
+from API.infrastructure.database.recruiting import BitrixOutbox, Vacancies
+from API.lib.bitrix.add import Bitrix
+from API.lib.bitrix.batch import ResultRef
+from API.lib.bitrix.upload import Base64File
+from API.lib.hh.HeadHunter import HeadHunter
+from API.lib.hh.files import ResumeFile
+from API.lib.hh.limiter import Priority, request_priority
+from API.lib.hh.resume_cache import ResumeCache, hh_resume_cache
+from API.lib.schemas.resume import Contacts, Resume, Salary
+from API.lib.schemas.vacation import Vacation
+
+
+def candidate_payload(
+        v: Vacancies,
+        i: Vacation
+) -> dict:
+    """What the outbox keeps of a negotiation to build its CRM item."""
+    return {
+        'resume': {
+            'id': i.resume.id,
+            'first_name': i.resume.first_name,
+            'middle_name': i.resume.middle_name,
+            'last_name': i.resume.last_name,
+            'salary': i.resume.salary.amount if i.resume.salary else None,
+            'updated_at': i.resume.updated_at
+        },
+        'vacancy': {
+            'id': v.id,
+            'vacancies_id': v.vacancies_id,
+            'deal_id': v.deal_id
+        }
+    }
+
+
+def payload_resume(
+        payload: dict
+) -> Resume:
+    fields = payload['resume']
+    return Resume(
+        id=fields['id'],
+        first_name=fields['first_name'],
+        middle_name=fields['middle_name'],
+        last_name=fields['last_name'],
+        salary=Salary(amount=fields['salary']) if fields['salary'] is not None else None,
+        updated_at=fields['updated_at']
+    )
+
+
+def candidate_commands(
+        negotiation_id: str,
+        vacancy: dict,
+        resume: Resume,
+        c: Contacts,
+        resume_file: ResumeFile,
+        contact_id: typing.Optional[str] = None
+) -> typing.Tuple[typing.Dict[str, typing.Tuple[str, dict]], typing.Optional[str]]:
+    """Batch commands of a candidate and the key of its crm.contact.add.
+
+    Without `contact_id` the contact is created in the same batch and the
+    item refers to it by key.
+    """
+    contact_email = ""
+    try:
+        if c.email and not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', c.email):
+            contact_email = c.email.rstrip(".")
+    except:
+        pass
+    contact_fields = {
+        "fields[NAME]": resume.first_name if resume.first_name else "",
+        "fields[SECOND_NAME]": resume.middle_name if resume.middle_name else "",
+        "fields[LAST_NAME]": resume.last_name if resume.last_name else "",
+        "fields[BIRTHDATE]": c.birth_date if c.birth_date else "",
+        "fields[PHONE][0][VALUE]": c.phone if c.phone else "",
+        "fields[PHONE][0][VALUE_TYPE]": "WORKMOBILE",
+        "fields[EMAIL][0][VALUE]": contact_email,
+        "fields[EMAIL][0][VALUE_TYPE]": "HOME",
+        "fields[WEB][0][VALUE]": f"https://hh.ru/resume/{resume.id}",
+        "fields[WEB][0][VALUE_TYPE]": "HOME",
+        # "fields[UF_CRM_1731574397751]": files_encoded
+        # "fields[COMMENTS]": "Testttttt",
+        #    "fields[SOURCE_ID][VALUE]": "334"
+    }
+    contact_key = None
+    commands = {}
+    if not contact_id:
+        contact_key = f"contact_{negotiation_id}"
+        commands[contact_key] = ('crm.contact.add', contact_fields)
+        contact_id = ResultRef(contact_key)
+    fields_item = {
+        "entityTypeId": 180,
+        "fields": {
+            'categoryId': 35,
+            # Read and encoded while the batch is sent, not held as base64
+            'ufCrm_13_1727330539': ["resume.pdf", Base64File(resume_file)],
+            'ufCrm_13_1745338188669': vacancy['deal_id'],
+            'ufCrm_13_1751297343872': str(negotiation_id),
+            'ufCrm_13_1751298240': str(vacancy['vacancies_id']),
+            'opportunity': resume.salary.amount if resume.salary else 0,
+            'contactId': contact_id
+        }
+    }
+    commands[f"item_{negotiation_id}"] = ('crm.item.add', fields_item)
+    return commands, contact_key
+
+
+@dataclass
+class Delivery:
+    """A claimed entry on its way to Bitrix."""
+    entry: BitrixOutbox
+    resume: typing.Optional[Resume] = None
+    commands: typing.Optional[typing.Dict[str, typing.Tuple[str, dict]]] = None
+    contact_key: typing.Optional[str] = None
+    resume_file: typing.Optional[ResumeFile] = None
+    error: typing.Optional[str] = None
+
+
+class BitrixOutboxWorkers:
+    """Pool of `workers` tasks sending the outbox entries to Bitrix.
+
+    Every worker claims up to `batch_size` due entries with SKIP LOCKED,
+    one batch request for all of them. A failed entry is retried with
+    backoff, up to `outbox_max_attempts`.
+    """
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker,
+            bitrix: typing.Optional[Bitrix] = None,
+            resume_cache: ResumeCache = hh_resume_cache,
+            settings: config.Bitrix = config.settings.bitrix,
+            shutdown_timeout: float = 30.0
+    ):
+        self.session_maker = session_maker
+        self.bitrix = bitrix or Bitrix()
+        self.resume_cache = resume_cache
+        self.workers = settings.outbox_workers
+        self.batch_size = settings.batch_candidates
+        self.poll_interval = settings.outbox_poll_interval
+        self.lease = settings.outbox_lease
+        self.max_attempts = settings.outbox_max_attempts
+        self.retry_base_delay = settings.outbox_retry_base_delay
+        self.retry_max_delay = settings.outbox_retry_max_delay
+        self.shutdown_timeout = shutdown_timeout
+        self.tasks: typing.List[asyncio.Task] = []
+        self.stopping: typing.Optional[asyncio.Event] = None
+
+    async def start(self):
+        if self.tasks:
+            return
+        self.stopping = asyncio.Event()
+        self.tasks = [asyncio.create_task(self.run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        if not self.tasks:
+            return
+        self.stopping.set()
+        # A worker in the middle of a batch finishes it; past the timeout its
+        # entries are claimed again when their lease expires
+        done, pending = await asyncio.wait(self.tasks, timeout=self.shutdown_timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def run(self):
+        # Resume downloads give way to the publication endpoints
+        request_priority.set(Priority.background)
+        while not self.stopping.is_set():
+            try:
+                delivered = await self.deliver_due()
+            except Exception as e:
+                logging.exception(e)
+                delivered = 0
+            if delivered:
+                continue
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self) -> int:
+        """Deliver the entries due now with `workers` concurrent claims."""
+        request_priority.set(Priority.background)
+
+        async def worker() -> int:
+            total = 0
+            while delivered := await self.deliver_due():
+                total += delivered
+            return total
+
+        return sum(await asyncio.gather(*(worker() for _ in range(self.workers))))
+
+    async def deliver_due(self) -> int:
+        """Claim, send and settle one batch of entries, return how many."""
+        entries = await self.claim()
+        if not entries:
+            return 0
+        hh = HeadHunter()
+        deliveries = await asyncio.gather(*(self.prepare(hh, entry) for entry in entries))
+        try:
+            await self.send(deliveries)
+        finally:
+            for delivery in deliveries:
+                if delivery.resume_file is not None:
+                    delivery.resume_file.close()
+        await self.settle(deliveries)
+        return len(entries)
+
+    async def claim(self) -> typing.Sequence[BitrixOutbox]:
+        session: AsyncSession = self.session_maker()
+        try:
+            entries = await BitrixOutbox.claim(session, limit=self.batch_size, lease=self.lease)
+            await session.commit()
+        finally:
+            await session.close()
+        return entries
+
+    async def prepare(
+            self,
+            hh: HeadHunter,
+            entry: BitrixOutbox
+    ) -> Delivery:
+        """Contacts and PDF of the candidate, from the cache or HH."""
+        delivery = Delivery(entry=entry)
+        try:
+            resume = delivery.resume = payload_resume(entry.payload)
+            cached = await self.resume_cache.get(resume)
+            c = None
+            if self.resume_cache.is_current(cached, resume):
+                c, delivery.resume_file = await self.resume_cache.load(cached)
+            if delivery.resume_file is None:
+                c, delivery.resume_file = await hh.get_resumes(resume.id)
+                if delivery.resume_file is None:
+                    delivery.error = f"Resume {resume.id} was not downloaded"
+                    return delivery
+                await self.resume_cache.save(resume, c, delivery.resume_file, cached)
+            delivery.commands, delivery.contact_key = candidate_commands(
+                negotiation_id=entry.negotiation_id,
+                vacancy=entry.payload['vacancy'],
+                resume=resume,
+                c=c,
+                resume_file=delivery.resume_file,
+                contact_id=entry.bitrix_contact_id or (cached.bitrix_contact_id if cached else None)
+            )
+        except Exception as e:
+            logging.exception(e)
+            delivery.error = repr(e)
+        return delivery
+
+    async def send(
+            self,
+            deliveries: typing.Sequence[Delivery]
+    ):
+        ready = [d for d in deliveries if d.error is None]
+        if not ready:
+            return
+        try:
+            results = await self.bitrix.batch_all(d.commands for d in ready)
+        except Exception as e:
+            logging.exception(e)
+            for d in ready:
+                d.error = repr(e)
+            return
+
+        for d in ready:
+            contact = results.get(d.contact_key)
+            if contact is not None and contact.ok:
+                # Kept even if the item failed: the retry must not add it again
+                d.entry.bitrix_contact_id = str(contact.result)
+                await self.resume_cache.set_bitrix_contact(d.resume.id, contact.result)
+            errors = [f"{key}: {results[key].error}" for key in d.commands if not results[key].ok]
+            if errors:
+                d.error = '; '.join(errors)
+
+    def retry_delay(self, attempts: int) -> float:
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempts - 1))
+        # Half fixed, half jitter: entries failed together come back apart
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def settle(
+            self,
+            deliveries: typing.Sequence[Delivery]
+    ):
+        """Remove the delivered entries, reschedule or dead-letter the others."""
+        now = datetime.datetime.now()
+        session: AsyncSession = self.session_maker()
+        try:
+            for d in deliveries:
+                # Untouched if the lease expired and another worker took the entry
+                owned = (BitrixOutbox.id == d.entry.id) & (BitrixOutbox.attempts == d.entry.attempts)
+                if d.error is None:
+                    await session.execute(delete(BitrixOutbox).where(owned))
+                    continue
+                dead = d.entry.attempts >= self.max_attempts
+                logging.info(
+                    f"Outbox entry {d.entry.id} (negotiation {d.entry.negotiation_id}) "
+                    f"failed, attempt {d.entry.attempts}{', dead-lettered' if dead else ''}: {d.error}"
+                )
+                await session.execute(
+                    update(BitrixOutbox).where(owned).values(
+                        status=BitrixOutbox.dead if dead else BitrixOutbox.pending,
+                        next_attempt_at=now + datetime.timedelta(seconds=self.retry_delay(d.entry.attempts)),
+                        locked_until=None,
+                        bitrix_contact_id=d.entry.bitrix_contact_id,
+                        last_error=d.error
+                    )
+                )
+            await session.commit()
+        finally:
+            await session.close()
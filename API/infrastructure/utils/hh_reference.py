@@ -0,0 +1,46 @@
+import datetime
+import typing
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from API.infrastructure.database.recruiting import ReferenceSnapshots
+from API.lib.hh.cache import ReferenceSnapshot
+
+
+class DatabaseReferenceStorage:
+    """Keeps the last fetched HH reference data in `reference_snapshots`."""
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker
+    ):
+        self.session_maker = session_maker
+
+    async def load_all(self) -> typing.List[ReferenceSnapshot]:
+        session: AsyncSession = self.session_maker()
+        try:
+            rows = await ReferenceSnapshots.get_all(session)
+        finally:
+            await session.close()
+        return [
+            ReferenceSnapshot(
+                name=row.name,
+                payload=row.payload,
+                fetched_at=row.fetched_at.timestamp()
+            )
+            for row in rows if row.payload is not None and row.fetched_at
+        ]
+
+    async def save(self, snapshot: ReferenceSnapshot) -> None:
+        session: AsyncSession = self.session_maker()
+        try:
+            await session.merge(
+                ReferenceSnapshots(
+                    name=snapshot.name,
+                    payload=snapshot.payload,
+                    fetched_at=datetime.datetime.fromtimestamp(snapshot.fetched_at)
+                )
+            )
+            await session.commit()
+        finally:
+            await session.close()
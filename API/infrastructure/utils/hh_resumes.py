@@ -0,0 +1,77 @@
+import datetime
+import typing
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from API.infrastructure.database.recruiting import ResumeCache
+from API.lib.hh.resume_cache import CachedResume
+
+
+class DatabaseResumeStorage:
+    """Keeps the entries of the HH resume cache in `resume_cache`."""
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker
+    ):
+        self.session_maker = session_maker
+
+    async def get(self, resume_id: str) -> typing.Optional[CachedResume]:
+        session: AsyncSession = self.session_maker()
+        try:
+            row = await ResumeCache.get(session, resume_id)
+        finally:
+            await session.close()
+        if row is None:
+            return None
+        return CachedResume(
+            resume_id=row.resume_id,
+            updated_at=row.updated_at,
+            contacts=row.contacts,
+            pdf_hash=row.pdf_hash,
+            pdf_size=row.pdf_size,
+            bitrix_contact_id=row.bitrix_contact_id
+        )
+
+    async def save(self, entry: CachedResume) -> None:
+        stmt = insert(ResumeCache).values(
+            resume_id=entry.resume_id,
+            updated_at=entry.updated_at,
+            contacts=entry.contacts,
+            pdf_hash=entry.pdf_hash,
+            pdf_size=entry.pdf_size,
+            bitrix_contact_id=entry.bitrix_contact_id,
+            fetched_at=datetime.datetime.now()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ResumeCache.resume_id],
+            set_={
+                'updated_at': stmt.excluded.updated_at,
+                'contacts': stmt.excluded.contacts,
+                'pdf_hash': stmt.excluded.pdf_hash,
+                'pdf_size': stmt.excluded.pdf_size,
+                # Never forget a contact that was already created in Bitrix
+                'bitrix_contact_id': func.coalesce(stmt.excluded.bitrix_contact_id, ResumeCache.bitrix_contact_id),
+                'fetched_at': stmt.excluded.fetched_at
+            }
+        )
+        session: AsyncSession = self.session_maker()
+        try:
+            await session.execute(stmt)
+            await session.commit()
+        finally:
+            await session.close()
+
+    async def set_bitrix_contact(self, resume_id: str, contact_id: str) -> None:
+        session: AsyncSession = self.session_maker()
+        try:
+            await session.execute(
+                update(ResumeCache)
+                .where(ResumeCache.resume_id == resume_id)
+                .values(bitrix_contact_id=contact_id)
+            )
+            await session.commit()
+        finally:
+            await session.close()
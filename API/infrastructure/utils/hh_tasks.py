@@ -1,142 +1,275 @@
 import logging
 import typing
-import base64
-import re
-import os
+from dataclasses import dataclass
 
-from API.infrastructure.database.recruiting import Vacancies, Resumes, Token
-from API.lib.bitrix.add import Bitrix
+from API import config
+from API.infrastructure.database.recruiting import BitrixOutbox, Negotiations, Vacancies, Resumes
+from API.infrastructure.utils.bitrix_outbox import candidate_payload
 from API.lib.hh.HeadHunter import HeadHunter
-from API.lib.schemas.vacation import VacationItems, Vacation
+from API.lib.hh.limiter import Priority, request_priority
+from API.lib.hh.resume_cache import hh_resume_cache
+from API.lib.job_stats import count_items
+from API.lib.pipeline import Pipeline, Stage
+from API.lib.schemas.states import ActionResult
+from API.lib.schemas.vacation import Vacation
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 import datetime
 
 
+def negotiation_created_at(
+        i: Vacation
+) -> typing.Optional[datetime.datetime]:
+    try:
+        return datetime.datetime.strptime(i.created_at, '%Y-%m-%dT%H:%M:%S%z')
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class VacancyScan:
+    """Progress of one auto_analysis run on a vacancy.
+
+    Responses are fetched newest first down to `since`, the newest one
+    handled by the previous run. The watermark moves on to `newest` only
+    if every page was fetched and screened, as soon as the last page of
+    the vacancy is screened.
+    """
+    vacancy: Vacancies
+    since: typing.Optional[datetime.datetime] = None
+    newest: typing.Optional[datetime.datetime] = None
+    # Pages handed to screen and not screened yet
+    pending: int = 0
+    fetched: bool = False
+    failed: bool = False
+
+    @property
+    def complete(self) -> bool:
+        return self.fetched and not self.failed and not self.pending
+
+
+async def save_watermark(
+        db_session,
+        scan: VacancyScan
+):
+    """Move the watermark of a completely screened vacancy, in its own session."""
+    if not scan.newest or scan.newest == scan.since:
+        return
+    session: AsyncSession = db_session()
+    try:
+        await Vacancies.set_responses_seen_at(session, scan.vacancy.id, scan.newest)
+        await session.commit()
+    except Exception as e:
+        # The next run fetches these responses again, screen skips them
+        logging.info(f"auto_analysis: watermark of vacancy {scan.vacancy.id} not saved: {e!r}")
+    finally:
+        await session.close()
+
+
+async def accept_page(
+        session: AsyncSession,
+        v: Vacancies,
+        page: typing.List[Vacation]
+) -> typing.List[Vacation]:
+    """Record the new negotiations of a page, return the ones to discard.
+
+    Negotiations handled by an earlier run are skipped. The state of the
+    negotiations, the accepted candidates and their outbox entries are
+    written in one transaction, with a statement each.
+    """
+    states = {}
+    for i in page:
+        too_expensive = i.resume.salary and i.resume.salary.amount > int(v.salary)
+        states[i.id] = Negotiations.rejected if too_expensive else Negotiations.accepted
+    new = await Negotiations.insert_new(
+        session,
+        [
+            {
+                'id': i.id,
+                'vacancies_id': v.id,
+                'resume_id': i.resume.id,
+                'first_name': i.resume.first_name,
+                'state': states[i.id],
+                'created_at': negotiation_created_at(i)
+            }
+            for i in page
+        ]
+    )
+    count_items(changed=len(new))
+    candidates = {i.id: i for i in page if i.id in new and states[i.id] == Negotiations.accepted}
+    # A candidate accepted before the negotiations table existed is
+    # already there: not sent to Bitrix twice
+    inserted = await Resumes.insert_new(session, v.id, candidates)
+    if inserted:
+        # Sent to Bitrix by the outbox workers: committed together, the
+        # candidate reaches Bitrix even if it is down right now
+        await session.execute(
+            insert(BitrixOutbox),
+            [
+                {
+                    'negotiation_id': nid,
+                    'vacancies_id': v.id,
+                    'payload': candidate_payload(v, candidates[nid])
+                }
+                for nid in inserted
+            ]
+        )
+    await session.commit()
+    for nid in inserted:
+        i = candidates[nid]
+        logging.info(
+            f"\nID: {i.id}\n"
+            f"AGE: {i.resume.age}\n"
+            f"SALARY: {i.resume.salary}\n"
+        )
+    return [i for i in page if i.id in new and states[i.id] == Negotiations.rejected]
+
+
 async def auto_analysis(
         db_session
 ):
+    """Screen the new responses of the active vacancies.
+
+    A pipeline of three stages: `fetch` pages through the responses of a
+    vacancy received since the previous run, up to `analysis_fetch_workers`
+    vacancies at a time, `screen` records the new
+    negotiations of a page (and the Resumes rows and outbox entries of the
+    accepted candidates) and passes the rejected ones on to `discard`,
+    which sends the discard letter.
+    """
+    # Publication endpoints go first when they compete with this job
+    request_priority.set(Priority.background)
+    settings = config.settings.hh
     session: AsyncSession = db_session()
-    vac = await Vacancies.get_vacancies(session)
-    token = await Token.get_token(session)
-    hh = HeadHunter(
-        basic_token=token.access_token,
-        refresh_token=token.refresh_token
+    try:
+        vac = await Vacancies.get_vacancies(session)
+        # Discards that HH did not confirm in the previous runs, oldest first
+        leftovers = await Negotiations.get_rejected(session, limit=settings.discard_retry_limit)
+    finally:
+        await session.close()
+    hh = HeadHunter()
+    discarded: typing.List[str] = []
+    failures: typing.List[ActionResult] = []
+    if leftovers:
+        results = await hh.discard_negotiations((n.id, n.first_name) for n in leftovers)
+        discarded.extend(r.id for r in results if r.ok)
+        failures.extend(r for r in results if not r.ok)
+
+    async def fetch(scan: VacancyScan):
+        v = scan.vacancy
+        genders = {
+            "female": v.gender,
+            "male": v.gender
+        }
+        pages = hh.iter_response_pages(
+            vacancy_id=int(v.vacancies_id),
+            age_from=str(v.age_from) if v.age_from else None,
+            age_to=str(v.age_to) if v.age_to else None,
+            gender=genders.get(v.gender, None),
+            #salary_from=0,
+            #salary_to=int(v.salary)
+            order_by='created_at',
+            order='desc'
+        )
+        try:
+            async for page in pages:
+                count_items(scanned=len(page))
+                new, reached = [], False
+                for i in page:
+                    created_at = negotiation_created_at(i)
+                    # The same second as the watermark is fetched again,
+                    # negotiations already handled are skipped by screen
+                    if scan.since and created_at and created_at < scan.since:
+                        reached = True
+                        continue
+                    if created_at and (scan.newest is None or created_at > scan.newest):
+                        scan.newest = created_at
+                    new.append(i)
+                if new:
+                    scan.pending += 1
+                    yield scan, new
+                if reached:
+                    break
+        except Exception:
+            # Only this vacancy is left behind: its watermark stays
+            logging.info(f"auto_analysis: fetching the responses of vacancy {v.id} failed")
+            raise
+        finally:
+            await pages.aclose()
+        scan.fetched = True
+        if scan.complete:
+            await save_watermark(db_session, scan)
+
+    async def screen(item: typing.Tuple[VacancyScan, typing.List[Vacation]]):
+        scan, page = item
+        # A session per page: the screen workers run side by side
+        page_session: AsyncSession = db_session()
+        screened = False
+        try:
+            rejected = await accept_page(page_session, scan.vacancy, page)
+            screened = True
+        finally:
+            await page_session.close()
+            scan.pending -= 1
+            if not screened:
+                logging.info(f"auto_analysis: screening a page of vacancy {scan.vacancy.id} failed")
+                scan.failed = True
+        if scan.complete:
+            await save_watermark(db_session, scan)
+        for i in rejected:
+            yield i.id, i.resume.first_name
+
+    async def discard(negotiation: typing.Tuple[str, str]):
+        result = await hh.discard_negotiation(*negotiation)
+        if not result.ok:
+            # Stays rejected, sent again by the next run unless HH refused it
+            logging.info(f"Negotiation {result.id} was not discarded: {result.error}")
+            failures.append(result)
+            return
+        discarded.append(result.id)
+
+    pipeline = Pipeline(
+        name='auto_analysis',
+        stages=[
+            Stage('fetch', fetch, workers=settings.analysis_fetch_workers,
+                  timeout=settings.analysis_fetch_timeout),
+            Stage('screen', screen, workers=settings.analysis_screen_workers,
+                  timeout=settings.analysis_screen_timeout),
+            Stage('discard', discard, workers=settings.discard_concurrency,
+                  timeout=settings.analysis_discard_timeout),
+        ],
+        queue_size=settings.analysis_queue_size
     )
-    valid_resumes = []
-    for v in vac:
-        vacancies = VacationItems()
-        vacancies.data = []
-        p = 0
-        while vacancies.found > len(vacancies.data):
-            #print(vacations.found, len(vacations.data))
-            genders = {
-                "female": v.gender,
-                "male": v.gender
-            }
+    scans = [VacancyScan(vacancy=v, since=v.responses_seen_at) for v in vac]
+    stats = await pipeline.run(scans)
 
-            vacancies = await hh.get_response(
-                vacancy_id=int(v.vacancies_id),
-                vacations=vacancies,
-                page=p,
-                age_from=str(v.age_from) if v.age_from else None,
-                age_to=str(v.age_to) if v.age_to else None,
-                gender=genders.get(v.gender, None),
-                #salary_from=0,
-                #salary_to=int(v.salary)
+    session = db_session()
+    try:
+        await Negotiations.set_state(session, discarded, Negotiations.discarded)
+        for result in failures:
+            await Negotiations.record_discard_failure(
+                session,
+                result.id,
+                error=result.error,
+                refused=result.refused,
+                max_attempts=settings.discard_max_attempts
             )
-            token.access_token = hh.basic_token
-            token.refresh_token = hh.ref_token
-            session.add(token)
-            await session.commit()
-            p += 1
-        if vacancies.data:
-            datas: typing.Sequence[Vacation] = vacancies.data
-            for i in datas:
-                resume = await Resumes.get_by_resume_id(
-                    session=session,
-                    resume_id=i.id,
-                    vacancies_id=v.id
-                )
-                if not resume:
-                    if i.resume.salary and i.resume.salary.amount > int(v.salary):
-                        continue
-                    r = Resumes(
-                        resume_id=i.id,
-                        vacancies_id=v.id
-                    )
-
-                    session.add(r)
-                    await session.commit()
-                    valid_resumes.append(i.id)
-                    logging.info(
-                        f"\nID: {i.id}\n"
-                        f"AGE: {i.resume.age}\n"
-                        f"SALARY: {i.resume.salary}\n"
-                    )
-                    c, path = await hh.get_resumes(i.resume.id)
-                    contact_email = ""
-                    try:
-                        if c.email and not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', c.email):
-                            contact_email = c.email.rstrip(".")
-                    except:
-                        pass
-                    try:
-                        contact_fields = {
-                            "fields[NAME]": i.resume.first_name if i.resume.first_name else "",
-                            "fields[SECOND_NAME]": i.resume.middle_name if i.resume.middle_name else "",
-                            "fields[LAST_NAME]": i.resume.last_name if i.resume.last_name else "",
-                            "fields[BIRTHDATE]": c.birth_date if c.birth_date else "",
-                            "fields[PHONE][0][VALUE]": c.phone if c.phone else "",
-                            "fields[PHONE][0][VALUE_TYPE]": "WORKMOBILE",
-                            "fields[EMAIL][0][VALUE]": contact_email,
-                            "fields[EMAIL][0][VALUE_TYPE]": "HOME",
-                            "fields[WEB][0][VALUE]": f"https://hh.ru/resume/{i.resume.id}",
-                            "fields[WEB][0][VALUE_TYPE]": "HOME",
-                            # "fields[UF_CRM_1731574397751]": files_encoded
-                            # "fields[COMMENTS]": "Testttttt",
-                            #    "fields[SOURCE_ID][VALUE]": "334"
-                        }
-                        bitrix = Bitrix()
-                        result = await bitrix.add_contact(fields=contact_fields)
-                        #print(result)
-                        with open(path, "rb") as file:
-                            encoded_content = base64.b64encode(file.read()).decode("utf-8")
-                        fields_item = {
-                            "entityTypeId": 180,
-                            "fields": {
-                                'categoryId': 35,
-                                'ufCrm_13_1727330539': ["resume.pdf", encoded_content],
-                                'ufCrm_13_1745338188669': v.deal_id,
-                                'ufCrm_13_1751297343872': str(r.resume_id),
-                                'ufCrm_13_1751298240': str(v.vacancies_id),
-                                'opportunity': i.resume.salary.amount if i.resume.salary else 0,
-                                'contactId': result.get('result')
-                            }
-                            # 'contactId':
-                        }
-                        #result.get('id')
-                        result = await bitrix.add_item(fields=fields_item)
-                        print(result)
-                        os.remove(path)
-                    except Exception as ex:
-                        print(ex)
-            for i in datas:
-                if i.id not in valid_resumes:
-                    text = '''{name} здравствуйте!
-
-Большое спасибо за интерес к вакансии! К сожалению, сейчас мы не готовы пригласить вас на следующий этап.
-Ценим ваше внимание и будем рады получать ваши отклики на другие позиции.
-
-Дюсембаева Акмарал Бакытовна
-                        '''
-                    result = await hh.negotiation_message(
-                        nid=i.id,
-                        message=text.format(name=i.resume.first_name)
-                    )
-                    # print(result)
-                    result = await hh.actions_negotiation(
-                        states_id="discard_by_employer",
-                        nid=i.id
-                    )
-
-    await session.close()
+        await session.commit()
+    finally:
+        await session.close()
+    for name, stage in stats.items():
+        logging.info(
+            f"auto_analysis {name}: {stage.ok} ok, {stage.errors} errors, "
+            f"{stage.timeouts} timeouts, {stage.busy_seconds:.1f}s busy"
+        )
+    return stats
+
+
+async def refresh_reference_data():
+    request_priority.set(Priority.background)
+    hh = HeadHunter()
+    await hh.reference.refresh_all(hh)
+
+
+async def evict_resume_files():
+    await hh_resume_cache.evict()
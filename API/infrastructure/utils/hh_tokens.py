@@ -0,0 +1,71 @@
+import logging
+import typing
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from API.infrastructure.database.recruiting import Token
+from API.lib.hh.token import Refresher, TokenState
+
+
+class DatabaseTokenStorage:
+    """Keeps the HeadHunter token of the process in the `tokens` table."""
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker
+    ):
+        self.session_maker = session_maker
+
+    @staticmethod
+    def to_state(token: Token) -> TokenState:
+        return TokenState(
+            access_token=token.access_token,
+            refresh_token=token.refresh_token,
+            expires_at=token.expires_at,
+            version=token.version or 0
+        )
+
+    async def load(self) -> typing.Optional[TokenState]:
+        session: AsyncSession = self.session_maker()
+        try:
+            token = await Token.get_token(session)
+        finally:
+            await session.close()
+        if not token:
+            return None
+        return self.to_state(token)
+
+    async def exchange(
+            self,
+            stale: TokenState,
+            refresher: Refresher
+    ) -> typing.Optional[TokenState]:
+        """Refresh the token under a row lock of the `tokens` table.
+
+        Every worker and the scheduler share a single HH refresh token, so
+        only the process holding the lock refreshes it. The others block on
+        SELECT ... FOR UPDATE and then find a newer version in the row.
+        """
+        session: AsyncSession = self.session_maker()
+        try:
+            async with session.begin():
+                token = await Token.get_token(session, for_update=True)
+                if token is None:
+                    token = Token(version=0)
+                    session.add(token)
+                elif token.version != stale.version or token.access_token != stale.access_token:
+                    logging.info(f"HH token was refreshed by another process (version {token.version})")
+                    return self.to_state(token)
+
+                state = await refresher(stale)
+                if state is None:
+                    return None
+                token.access_token = state.access_token
+                token.refresh_token = state.refresh_token
+                token.expires_at = state.expires_at
+                token.version = (token.version or 0) + 1
+                state.version = token.version
+            logging.info(f"HH token saved (version {state.version})")
+            return state
+        finally:
+            await session.close()
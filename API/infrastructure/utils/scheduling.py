@@ -0,0 +1,243 @@
+"""
+Scheduled jobs run once per cluster, guarded by Postgres advisory locks.
+"""
+import asyncio
+import contextlib
+import datetime
+import functools
+import hashlib
+import logging
+import time
+import typing
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, async_sessionmaker
+
+from API import config
+from API.infrastructure.database.jobs import JobRuns
+from API.lib.job_stats import JobStats, MemorySampler, current_job
+
+
+def lock_key(name: str) -> int:
+    """Advisory lock key of `name`: a signed bigint, stable across processes."""
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+async def try_lock(
+        connection: AsyncConnection,
+        name: str
+) -> bool:
+    acquired = await connection.scalar(select(func.pg_try_advisory_lock(lock_key(name))))
+    # A session level lock outlives the transaction: the connection does
+    # not stay idle in transaction while it holds the lock
+    await connection.commit()
+    return bool(acquired)
+
+
+async def unlock(
+        connection: AsyncConnection,
+        name: str
+):
+    await connection.scalar(select(func.pg_advisory_unlock(lock_key(name))))
+    await connection.commit()
+
+
+@contextlib.asynccontextmanager
+async def advisory_lock(
+        engine: AsyncEngine,
+        name: str
+) -> typing.AsyncIterator[bool]:
+    """Hold the advisory lock `name` if it is free; yields whether it is held."""
+    async with engine.connect() as connection:
+        acquired = await try_lock(connection, name)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    await unlock(connection, name)
+                except Exception as e:
+                    # Closing the connection releases the lock anyway
+                    logging.info(f"Advisory lock {name} not released: {e!r}")
+                    await connection.invalidate()
+
+
+def single_run(
+        engine: AsyncEngine,
+        job: typing.Callable[..., typing.Awaitable],
+        name: typing.Optional[str] = None
+) -> typing.Callable[..., typing.Awaitable]:
+    """`job` skipped while a run of it holds its lock anywhere in the cluster."""
+    name = name or f"job:{job.__module__}.{job.__qualname__}"
+
+    @functools.wraps(job)
+    async def run(*args, **kwargs):
+        async with advisory_lock(engine, name) as acquired:
+            if not acquired:
+                logging.info(f"{job.__name__} skipped: the previous run is still going")
+                return None
+            return await job(*args, **kwargs)
+
+    return run
+
+
+def recorded(
+        session_maker: async_sessionmaker,
+        job: typing.Callable[..., typing.Awaitable],
+        name: typing.Optional[str] = None
+) -> typing.Callable[..., typing.Awaitable]:
+    """`job` with every run, and the JobStats it gathered, kept in `job_runs`."""
+    name = name or job.__name__
+
+    @functools.wraps(job)
+    async def run(*args, **kwargs):
+        stats = JobStats()
+        token = current_job.set(stats)
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        started = time.perf_counter()
+        memory = MemorySampler()
+        error = None
+        try:
+            async with memory:
+                return await job(*args, **kwargs)
+        except BaseException as e:
+            # Cancelled included: the run did not finish
+            error = repr(e)
+            raise
+        finally:
+            current_job.reset(token)
+            stats.peak_memory = memory.peak
+            await save_run(session_maker, name, stats, started_at, time.perf_counter() - started, error)
+
+    return run
+
+
+async def save_run(
+        session_maker: async_sessionmaker,
+        name: str,
+        stats: JobStats,
+        started_at: datetime.datetime,
+        duration: float,
+        error: typing.Optional[str]
+):
+    session: AsyncSession = session_maker()
+    try:
+        session.add(JobRuns(
+            job=name,
+            status=JobRuns.failed if error else JobRuns.ok,
+            started_at=started_at,
+            finished_at=started_at + datetime.timedelta(seconds=duration),
+            duration=duration,
+            stages={
+                stage: {'seconds': round(f.seconds, 3), 'items': f.items, 'errors': f.errors}
+                for stage, f in stats.stages.items()
+            },
+            items_scanned=stats.items_scanned,
+            items_changed=stats.items_changed,
+            http_calls=stats.http_calls,
+            errors=stats.errors + (1 if error else 0),
+            error=error,
+            peak_memory=stats.peak_memory
+        ))
+        await session.commit()
+    except Exception as e:
+        # The ledger is best effort: the job itself is done
+        logging.info(f"Run of {name} not recorded: {e!r}")
+    finally:
+        await session.close()
+
+
+class SchedulerLeader:
+    """Resumes `scheduler` while this process holds the leader lock.
+
+    Every `check_interval` seconds a follower tries to take the lock and
+    the leader makes sure its connection, and so the lock, is still alive;
+    a leader that lost it pauses its scheduler.
+    """
+
+    def __init__(
+            self,
+            engine: AsyncEngine,
+            scheduler: AsyncIOScheduler,
+            name: str = 'scheduler:leader',
+            check_interval: float = config.settings.scheduler.leader_check_interval
+    ):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.name = name
+        self.check_interval = check_interval
+        self.connection: typing.Optional[AsyncConnection] = None
+        self.task: typing.Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.connection is not None
+
+    async def start(self):
+        if self.task is not None:
+            return
+        if not self.scheduler.running:
+            self.scheduler.start(paused=True)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        if self.connection is not None:
+            try:
+                await unlock(self.connection, self.name)
+            except Exception as e:
+                logging.info(f"Leader lock not released: {e!r}")
+            await self.resign()
+
+    async def run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logging.exception(e)
+                await self.resign()
+            await asyncio.sleep(self.check_interval)
+
+    async def check(self):
+        if self.connection is not None:
+            # Raises if the connection, and with it the lock, is gone
+            await self.connection.scalar(select(1))
+            await self.connection.commit()
+            return
+        connection = await self.engine.connect()
+        try:
+            acquired = await try_lock(connection, self.name)
+        except Exception:
+            await connection.close()
+            raise
+        if not acquired:
+            await connection.close()
+            return
+        self.connection = connection
+        # Runs due while this process followed were the former leader's:
+        # every job waits for its next fire time from now
+        for job in self.scheduler.get_jobs():
+            job.reschedule(job.trigger)
+        self.scheduler.resume()
+        logging.info("This process runs the scheduled jobs")
+
+    async def resign(self):
+        if self.scheduler.running:
+            self.scheduler.pause()
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        try:
+            # Not back to the pool: the connection may still hold the lock
+            await connection.invalidate()
+            await connection.close()
+        except Exception as e:
+            logging.info(f"Leader connection not closed: {e!r}")
@@ -1,6 +1,7 @@
 import logging
 
 from API.infrastructure.database.vacation import StaffVacation, VacationDays
+from API.lib.job_stats import count_items
 from sqlalchemy.ext.asyncio import AsyncSession
 import datetime
 
@@ -10,6 +11,7 @@ async def add_vacation_days(
 ):
     session: AsyncSession = db_session()
     staffs = await StaffVacation.get_all_user(session)
+    count_items(scanned=len(staffs))
     logging.info(f"Добавляем дни")
     for staff in staffs:
         vacations = await VacationDays.get_staff_vac_by_id(
@@ -30,6 +32,7 @@ async def add_vacation_days(
                 import math
                 v.days = math.floor(v.dbl_days + 0.5)
                 session.add(v)
+                count_items(changed=1)
 
     await session.commit()
     await session.close()
@@ -40,6 +43,7 @@ async def check_work_period(
 ):
     session: AsyncSession = db_session()
     staffs = await StaffVacation.get_all_user(session)
+    count_items(scanned=len(staffs))
     for staff in staffs:
         date_today = datetime.datetime.today().date()
 #        date_today = datetime.datetime.strptime("02.05.2025", "%d.%m.%Y")
@@ -60,5 +64,6 @@ async def check_work_period(
                 dbl_days=0.0
             )
             session.add(vacation)
+            count_items(changed=1)
     await session.commit()
     await session.close()
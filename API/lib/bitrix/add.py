@@ -1,4 +1,8 @@
+import typing
+
 from API.lib.bitrix.base import BaseApi, MethodRequest
+from API.lib.bitrix.batch import BATCH_LIMIT, BatchResult, command_files, encode_command, pack_batches, parse_batch
+from API.lib.bitrix.upload import JsonBody
 
 
 class Bitrix(BaseApi):
@@ -50,7 +54,55 @@ class Bitrix(BaseApi):
             url=url,
             json_status=True,
             answer_log=False,
-            json=fields
+            # Base64File values are encoded while the request is sent
+            **JsonBody(fields).request_kwargs()
         )
 
         return result
+
+    async def batch(
+            self,
+            commands: typing.Dict[str, typing.Tuple[str, dict]],
+            halt: bool = False
+    ) -> typing.Dict[str, BatchResult]:
+        """Run up to 50 commands {key: (method, params)} in one request.
+
+        Params may hold ResultRef(key) to use the result of an earlier
+        command, and Base64File for a file content. With `halt` Bitrix stops at the first failed command.
+        """
+        if len(commands) > BATCH_LIMIT:
+            raise ValueError(f"Bitrix runs at most {BATCH_LIMIT} commands per batch, got {len(commands)}")
+        url = self.url.format(method='batch')
+        result = await self.request_session(
+            method=MethodRequest.post,
+            url=url,
+            json_status=True,
+            answer_log=False,
+            **JsonBody(
+                {
+                    'halt': int(halt),
+                    'cmd': {
+                        key: encode_command(method, params)
+                        for key, (method, params) in commands.items()
+                    }
+                },
+                files=command_files(commands)
+            ).request_kwargs()
+        )
+
+        return parse_batch(commands, result)
+
+    async def batch_all(
+            self,
+            groups: typing.Iterable[typing.Dict[str, typing.Tuple[str, dict]]],
+            halt: bool = False
+    ) -> typing.Dict[str, BatchResult]:
+        """Run groups of commands in as few batches as possible.
+
+        A group (e.g. a contact and the item referencing it) always goes
+        into a single batch.
+        """
+        results = {}
+        for commands in pack_batches(groups):
+            results.update(await self.batch(commands, halt=halt))
+        return results
@@ -6,6 +6,10 @@ import aiohttp
 import requests
 
 from API import config
+from API.lib.metrics import last_segment_endpoint, trace_config
+from API.lib.redact import Redacted
+from API.lib.resilience import TRANSIENT_ERRORS, CircuitBreaker, RetryPolicy, UpstreamUnavailable
+from API.lib.session import SessionPool
 
 
 class MethodRequest:
@@ -24,22 +28,36 @@ def to_format(
     return data
 
 
+bitrix_session_pool = SessionPool.from_settings(
+    'bitrix',
+    config.settings.bitrix,
+    trace_configs=[trace_config('bitrix', endpoint=last_segment_endpoint)]
+)
+bitrix_retry_policy = RetryPolicy.from_settings(config.settings.bitrix)
+bitrix_breaker = CircuitBreaker.from_settings('bitrix', config.settings.bitrix)
+
+
 class BaseApi:
 
     def __init__(
             self,
             user_id: str = config.BITRIX_USER_ID,
             basic_token: str = config.BITRIX_TOKEN,
+            session_pool: SessionPool = bitrix_session_pool,
+            retry_policy: RetryPolicy = bitrix_retry_policy,
+            breaker: CircuitBreaker = bitrix_breaker
     ):
-        self.production_url = f'https://bitrix.qazaqrepublic.com/rest/{user_id}/{basic_token}/' + '{method}'
+        self.production_url = f'{config.settings.bitrix.api_url}/{user_id}/{basic_token}/' + '{method}'
+        self.session_pool = session_pool
+        self.retry_policy = retry_policy
+        self.breaker = breaker
 
     @property
     def url(self) -> str:
         return self.production_url
 
-    @classmethod
     async def request_session(
-            cls,
+            self,
             method: MethodRequest.get,
             url: str,
             json_status: bool = True,
@@ -47,35 +65,59 @@ class BaseApi:
             **kwargs
 
     ):
-        print(f"dict - > {kwargs}")
-        logging.info(
-            f"METHOD {method}\nURL - {url}\n"
-        )
-
-        async with aiohttp.ClientSession() as session:
-            response = await session.request(
-                method=method,
-                url=url,
-                **kwargs
-            )
-
-            if response.status == 400:
-                logging.info("STATUS CODE -> 400")
-                # data = await response.read()
-                # logging.info(data)
-                return
-
+        # The webhook url holds the token: only the REST method is logged
+        rest_method = url.rsplit('/', 1)[-1]
+        logging.debug("Bitrix %s %s %s", method, rest_method, Redacted(kwargs))
+
+        session = await self.session_pool.get()
+        retry = self.retry_policy.start(method, self.breaker)
+        while True:
+            self.breaker.before_request()
             try:
-                if json_status:
-                    data = await response.read()
-                    data = json.loads(data)
-                    return data
-            except Exception as e:
-                logging.exception(e)
-            finally:
-                if answer_log:
-                    logging.info(
-                        f'ANSWER: {await response.text()}'
-                    )
-
-            return response
+                async with session.request(
+                        method=method,
+                        url=url,
+                        timeout=retry.timeout(session.timeout),
+                        **kwargs
+                ) as response:
+                    if response.status in self.retry_policy.statuses:
+                        logging.info("Bitrix %s answered %s", rest_method, response.status)
+                        if await retry.backoff(response.status):
+                            continue
+                        raise UpstreamUnavailable('bitrix', response.status)
+                    self.breaker.record_success()
+                    return await self.read_response(response, json_status, answer_log)
+            except TRANSIENT_ERRORS as e:
+                logging.info("Bitrix %s %s failed: %r", method, rest_method, e)
+                if await retry.backoff(e):
+                    continue
+                raise
+
+    @staticmethod
+    async def read_response(
+            response: aiohttp.ClientResponse,
+            json_status: bool,
+            answer_log: bool
+    ):
+        if response.status == 400:
+            logging.info("STATUS CODE -> 400")
+            # data = await response.read()
+            # logging.info(data)
+            return
+
+        try:
+            if json_status:
+                data = await response.read()
+                data = json.loads(data)
+                return data
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            logging.exception(e)
+        finally:
+            if answer_log:
+                logging.info("ANSWER: %s", Redacted(await response.text()))
+
+        # Read the body so the connection goes back to the pool
+        await response.read()
+        return response
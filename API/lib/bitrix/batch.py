@@ -0,0 +1,141 @@
+"""
+Commands of the Bitrix `batch` method, up to 50 REST calls in one request.
+"""
+import typing
+from dataclasses import dataclass
+from urllib.parse import quote, quote_plus
+
+from API.lib.bitrix.upload import Base64File
+
+__all__ = ("BATCH_LIMIT", "ResultRef", "BatchResult", "encode_command",
+           "command_files", "parse_batch", "pack_batches", )
+
+BATCH_LIMIT = 50
+
+# key -> (REST method, parameters)
+Commands = typing.Dict[str, typing.Tuple[str, dict]]
+
+
+@dataclass(frozen=True)
+class ResultRef:
+    """`$result[key]` (or `$result[key][item][id]` with a path) in a command."""
+    key: str
+    path: typing.Tuple[str, ...] = ()
+
+    def __str__(self) -> str:
+        return f"$result[{self.key}]" + ''.join(f"[{p}]" for p in self.path)
+
+
+@dataclass
+class BatchResult:
+    key: str
+    result: typing.Any = None
+    error: typing.Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _flatten(
+        prefix: str,
+        value: typing.Any
+) -> typing.Iterator[typing.Tuple[str, typing.Any]]:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield from _flatten(f"{prefix}[{k}]" if prefix else str(k), v)
+    elif isinstance(value, (list, tuple)):
+        for index, v in enumerate(value):
+            yield from _flatten(f"{prefix}[{index}]", v)
+    else:
+        yield prefix, value
+
+
+def _encode_value(value: typing.Any) -> str:
+    if isinstance(value, ResultRef):
+        # Substituted by Bitrix before the command is parsed: keep it raw
+        return str(value)
+    if isinstance(value, Base64File):
+        # Streamed into the body by JsonBody, already quoted
+        return value.marker(quoted=True)
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Y' if value else 'N'
+    return quote_plus(str(value))
+
+
+def encode_command(
+        method: str,
+        params: dict
+) -> str:
+    """`method?params` with nested params in the PHP http_build_query form."""
+    query = '&'.join(
+        f"{quote(key, safe='[]')}={_encode_value(value)}"
+        for key, value in _flatten('', params)
+    )
+    return f"{method}?{query}" if query else method
+
+
+def command_files(
+        commands: Commands
+) -> typing.List[Base64File]:
+    """Base64File values of the commands, to stream them with JsonBody."""
+    return [
+        value
+        for _, params in commands.values()
+        for _, value in _flatten('', params)
+        if isinstance(value, Base64File)
+    ]
+
+
+def _as_dict(value) -> dict:
+    # PHP sends an empty associative array as []
+    return value if isinstance(value, dict) else {}
+
+
+def parse_batch(
+        keys: typing.Iterable[str],
+        answer: typing.Optional[dict]
+) -> typing.Dict[str, BatchResult]:
+    """Result or error of every command key from the answer of `batch`."""
+    if not isinstance(answer, dict) or 'result' not in answer:
+        answer = answer if isinstance(answer, dict) else {}
+        error = answer.get('error_description') or answer.get('error') or 'no answer from Bitrix'
+        return {key: BatchResult(key=key, error=error) for key in keys}
+
+    results = _as_dict(answer['result'].get('result'))
+    errors = _as_dict(answer['result'].get('result_error'))
+    parsed = {}
+    for key in keys:
+        if key in errors:
+            error = errors[key]
+            if isinstance(error, dict):
+                error = error.get('error_description') or error.get('error')
+            parsed[key] = BatchResult(key=key, error=str(error))
+        elif key in results:
+            parsed[key] = BatchResult(key=key, result=results[key])
+        else:
+            # Not run: an earlier command failed with halt=1
+            parsed[key] = BatchResult(key=key, error='not executed')
+    return parsed
+
+
+def pack_batches(
+        groups: typing.Iterable[Commands],
+        limit: int = BATCH_LIMIT
+) -> typing.Iterator[Commands]:
+    """Pack groups of commands into batches of at most `limit` commands.
+
+    A group is never split, so its back-references stay in one batch.
+    """
+    batch: Commands = {}
+    for group in groups:
+        if len(group) > limit:
+            raise ValueError(f"A group of {len(group)} commands does not fit into a batch of {limit}")
+        if len(batch) + len(group) > limit:
+            yield batch
+            batch = {}
+        batch.update(group)
+    if batch:
+        yield batch
@@ -0,0 +1,109 @@
+"""
+Files sent to Bitrix without holding their base64 in memory.
+"""
+import asyncio
+import base64
+import json
+import re
+import typing
+import uuid
+from urllib.parse import quote
+
+from API.lib.hh.files import ResumeFile
+
+__all__ = ("ENCODE_CHUNK_SIZE", "Base64File", "JsonBody", )
+
+# A multiple of 3: the base64 of the chunks concatenates without padding
+ENCODE_CHUNK_SIZE = 48 * 1024
+
+_MARKER = re.compile(r'@@base64:([0-9a-f]{32}):([qp])@@')
+
+
+class Base64File:
+    """The base64 content of `resume_file`, encoded when the body is sent."""
+
+    def __init__(
+            self,
+            resume_file: ResumeFile,
+            chunk_size: int = ENCODE_CHUNK_SIZE
+    ):
+        if chunk_size % 3:
+            raise ValueError(f"chunk_size must be a multiple of 3, got {chunk_size}")
+        self.resume_file = resume_file
+        self.chunk_size = chunk_size
+        self.token = uuid.uuid4().hex
+
+    def marker(self, quoted: bool = False) -> str:
+        """Placeholder of the content; `quoted` for a query string value."""
+        return f"@@base64:{self.token}:{'q' if quoted else 'p'}@@"
+
+    def _encode(
+            self,
+            offset: int,
+            quoted: bool
+    ) -> bytes:
+        self.resume_file.file.seek(offset)
+        chunk = base64.b64encode(self.resume_file.file.read(self.chunk_size))
+        if quoted:
+            # '+', '/' and '=' are not literal in a query string
+            chunk = quote(chunk, safe='').encode()
+        return chunk
+
+    async def chunks(
+            self,
+            quoted: bool = False
+    ) -> typing.AsyncIterator[bytes]:
+        # Every pass starts from the beginning of the file: a retried request
+        # sends the whole content again
+        offset = 0
+        while chunk := await asyncio.to_thread(self._encode, offset, quoted):
+            yield chunk
+            offset += self.chunk_size
+
+    def __repr__(self) -> str:
+        return f"<base64 of {self.resume_file.size} bytes>"
+
+
+class JsonBody:
+    """A JSON request body whose Base64File values are streamed.
+
+    Base64File values of `body` are found while it is serialised; the
+    markers of files already rendered into strings (batch commands) are
+    resolved with `files`. Pass it with `request_kwargs()`: without files
+    the body is sent as a plain string.
+    """
+
+    content_type = 'application/json'
+
+    def __init__(
+            self,
+            body: typing.Any,
+            files: typing.Iterable[Base64File] = ()
+    ):
+        self.files = {file.token: file for file in files}
+
+        def default(value):
+            if isinstance(value, Base64File):
+                self.files[value.token] = value
+                return value.marker()
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+        # [text, token, mode, text, token, mode, ..., text]
+        self.parts = _MARKER.split(json.dumps(body, default=default))
+
+    async def __aiter__(self) -> typing.AsyncIterator[bytes]:
+        yield self.parts[0].encode()
+        for index in range(1, len(self.parts), 3):
+            token, mode, text = self.parts[index:index + 3]
+            async for chunk in self.files[token].chunks(quoted=mode == 'q'):
+                yield chunk
+            if text:
+                yield text.encode()
+
+    def request_kwargs(self) -> dict:
+        """Keyword arguments of aiohttp `request` sending this body."""
+        data = self.parts[0] if len(self.parts) == 1 else self
+        return {'data': data, 'headers': {'Content-Type': self.content_type}}
+
+    def __repr__(self) -> str:
+        return f"<json body with {len(self.parts) // 3} streamed files>"
@@ -1,28 +1,41 @@
+import asyncio
+import collections
 import logging
+import math
 import typing
 from typing import Type
 
+from API import config
+
 from API.lib.hh.base import BaseApi, MethodRequest
-from API.lib.schemas.directories import Directories, ItemDirectories
-from API.lib.schemas.resume import (Areas, Experience, Education, Gender, Level, Primary,
-                                    ItemAreas, Resume, Salary, Contacts)
+from API.lib.hh.decoder import decode_contacts, decode_negotiations, resume_pdf_url
+from API.lib.hh.files import ResumeFile
+from API.lib.hh.cache import DictionaryCache, ReferenceCache, hh_dictionaries, hh_reference
+from API.lib.hh.texts import discard_message
+from API.lib.resilience import UpstreamUnavailable
+from API.lib.schemas.directories import ItemDirectories
+from API.lib.schemas.resume import Areas, ItemAreas, Contacts
 from API.lib.schemas.manager import Manager, ItemsManager, Phones
 from API.lib.schemas.address import Address, ItemsAddress
 from API.lib.schemas.templates import Templates, ItemsTemplate
 from API.lib.schemas.categories import Categories, ItemsCategories
 from API.lib.schemas.roles import Roles
 from API.lib.schemas.vacation import Vacation, VacationItems
-from API.lib.schemas.states import States, CollectionStates
+from API.lib.schemas.states import ActionResult, States, CollectionStates
 
 
 class HeadHunter(BaseApi):
 
     def __init__(
             self,
-            basic_token: str,
-            refresh_token: str
+            basic_token: str = None,
+            refresh_token: str = None,
+            dictionaries: DictionaryCache = hh_dictionaries,
+            reference: ReferenceCache = hh_reference
     ):
         super().__init__(basic_token=basic_token, ref_token=refresh_token)
+        self.dictionaries = dictionaries
+        self.reference = reference
 
     async def get_vacancies(
             self
@@ -47,12 +60,16 @@ class HeadHunter(BaseApi):
             gender: str = None,
             salary_from: int = None,
             salary_to: int = None,
-            currency: str = 'KZT'
+            currency: str = 'KZT',
+            per_page: int = config.settings.hh.per_page,
+            order_by: str = None,
+            order: str = None
     ):
         
         query_parameters = {
             'vacancy_id': vacancy_id,
             'page': page,
+            'per_page': per_page,
             'currency': currency
         }
         if age_to:
@@ -65,6 +82,10 @@ class HeadHunter(BaseApi):
             query_parameters['salary_from'] = salary_from
         if salary_to:
             query_parameters['salary_to'] = salary_to
+        if order_by:
+            query_parameters['order_by'] = order_by
+        if order:
+            query_parameters['order'] = order
         url = self.url.format(method='negotiations/response')
         result = await self.request_session(
             method=MethodRequest.get,
@@ -73,82 +94,95 @@ class HeadHunter(BaseApi):
             answer_log=False,
             params=query_parameters
         )
-        if not vacations:
-            vacations = VacationItems()
-        # print(result)
-        vacations.found = result.get('found')
-        if result.get('items'):
-            for i in result.get('items'):
-                salary = None
-                gender = None
-                if i.get('resume').get('salary'):
-                    salary = Salary()
-                    salary.currency = i.get('resume').get('salary').get('currency', None)
-                    salary.amount = i.get('resume').get('salary').get('amount', None)
-                if i.get('resume').get('gender'):
-                    gender = Gender(
-                        id=i.get('resume').get('gender').get('id', None),
-                        name=i.get('resume').get('gender').get('name', None)
-                    )
-                resume = Resume(
-                    id=i.get('resume').get('id'),
-                    last_name=i.get('resume').get('last_name'),
-                    first_name=i.get('resume').get('first_name'),
-                    middle_name=i.get('resume').get('middle_name'),
-                    title=i.get('resume').get('title'),
-                    area=Areas(
-                        id=i.get('resume').get('area').get('id'),
-                        name=i.get('resume').get('area').get('name')
-                    ),
-                    age=i.get('resume').get('age'),
-                    gender=gender,
-                    salary=salary,
-                    total_experience=i.get('resume').get('total_experience')
-                )
-                vacation = Vacation(
-                    id=i.get('id'),
-                    state=States(
-                        id=i.get('state').get('id'),
-                        name=i.get('state').get('name')
-                    ),
-                    created_at=i.get('created_at')
-                )
-                education = Education()
-                if i.get('resume') and i.get('resume').get('education') and i.get('resume').get('education').get('level'):
-                    education.level = Level(
-                        id=i.get('resume').get('education').get('level').get('id'),
-                        name=i.get('resume').get('education').get('level').get('name')
-                    )
-                if i.get('resume'):
-                    if i.get('resume').get('primary'):
-                        education.primary = []
-                        for j in i.get('resume').get('primary'):
-                            education.primary.append(
-                                Primary(
-                                    id=j.get('id'),
-                                    name=j.get('name')
-                                )
-                            )
-                    if i.get('resume').get('experience'):
-                        resume.experience = []
-                        for j in i.get('resume').get('experience'):
-                            e = Experience(
-                                start=j.get('start'),
-                                end=j.get('end'),
-                                company_id=j.get('company_id'),
-                                industry=j.get('industry'),
-                                company=j.get('company'),
-                                company_url=j.get('company_url'),
-                                position=j.get('position')
-                            )
-                            if j.get('area'):
-                                e.area = Areas(
-                                    id=j.get('area').get('id'),
-                                    name=j.get('area').get('name')
-                                )
-                            resume.experience.append(e)
-                vacation.resume = resume
-                vacations.append_item(vacation)
+        return decode_negotiations(result, vacations)
+
+    async def iter_response_pages(
+            self,
+            vacancy_id: str | int,
+            concurrency: int = config.settings.hh.page_concurrency,
+            per_page: int = config.settings.hh.per_page,
+            **filters
+    ) -> typing.AsyncIterator[typing.List[Vacation]]:
+        """Yield the responses of a vacancy a page at a time, as the pages arrive.
+
+        Page 0 tells how many pages there are; at most `concurrency` of the
+        following pages are downloaded ahead of the consumer, so memory is
+        bounded whatever the size of the vacancy. `filters` are passed to
+        get_response (age_to, age_from, gender, order_by, ...). A consumer
+        that stops early closes the generator (aclose) to cancel the pages
+        still downloading.
+        """
+        first = await self.get_response(
+            vacancy_id=vacancy_id,
+            page=0,
+            per_page=per_page,
+            **filters
+        )
+        pages = first.pages
+        if pages is None:
+            pages = math.ceil((first.found or 0) / per_page)
+        yield first.data or []
+        del first
+
+        pending: typing.Deque[asyncio.Task] = collections.deque()
+        next_page = 1
+        try:
+            while next_page < pages or pending:
+                while next_page < pages and len(pending) < concurrency:
+                    pending.append(asyncio.create_task(
+                        self.get_response(
+                            vacancy_id=vacancy_id,
+                            page=next_page,
+                            per_page=per_page,
+                            **filters
+                        )
+                    ))
+                    next_page += 1
+                items = await pending.popleft()
+                yield items.data or []
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def iter_responses(
+            self,
+            vacancy_id: str | int,
+            concurrency: int = config.settings.hh.page_concurrency,
+            per_page: int = config.settings.hh.per_page,
+            **filters
+    ) -> typing.AsyncIterator[Vacation]:
+        """Yield the responses of a vacancy one by one, see iter_response_pages."""
+        pages = self.iter_response_pages(
+            vacancy_id=vacancy_id,
+            concurrency=concurrency,
+            per_page=per_page,
+            **filters
+        )
+        try:
+            async for page in pages:
+                for item in page:
+                    yield item
+        finally:
+            await pages.aclose()
+
+    async def get_all_responses(
+            self,
+            vacancy_id: str | int,
+            concurrency: int = config.settings.hh.page_concurrency,
+            per_page: int = config.settings.hh.per_page,
+            **filters
+    ) -> VacationItems:
+        """All responses of a vacancy collected from iter_responses, in page order."""
+        vacations = VacationItems()
+        vacations.data = []
+        async for item in self.iter_responses(
+                vacancy_id=vacancy_id,
+                concurrency=concurrency,
+                per_page=per_page,
+                **filters
+        ):
+            vacations.append_item(item)
+        vacations.found = len(vacations.data)
         return vacations
 
     async def get_negotiation(
@@ -168,18 +202,73 @@ class HeadHunter(BaseApi):
     async def actions_negotiation(
             self,
             states_id: str,
-            nid: str
+            nid: str,
+            message: typing.Optional[str] = None
     ):
+        """Move the negotiation to `states_id`.
+
+        HH sends `message` to the candidate as part of the same request, so
+        a discard with a letter is a single call.
+        """
         url = self.url.format(method=f'negotiations/{states_id}/{nid}')
         result = await self.request_session(
             method=MethodRequest.put,
             url=url,
             json_status=False,
             answer_log=False,
+            data={"message": message} if message else None
             # headers=headers
         )
         return result
 
+    async def discard_negotiation(
+            self,
+            nid: str,
+            name: typing.Optional[str] = None
+    ) -> ActionResult:
+        """Discard a negotiation with the discard letter, never raises."""
+        try:
+            response = await self.actions_negotiation(
+                states_id="discard_by_employer",
+                nid=nid,
+                message=discard_message(name)
+            )
+        except Exception as e:
+            logging.info(f"Negotiation {nid} was not discarded: {e!r}")
+            return ActionResult(
+                id=nid,
+                status=e.status if isinstance(e, UpstreamUnavailable) else None,
+                error=str(e) or type(e).__name__
+            )
+        if response is None:
+            # read_response answers a 400 with None
+            return ActionResult(id=nid, status=400, error='HH did not accept the request')
+        return ActionResult(
+            id=nid,
+            ok=response.status < 300,
+            status=response.status,
+            error=None if response.status < 300 else response.reason
+        )
+
+    async def discard_negotiations(
+            self,
+            items: typing.Iterable[typing.Tuple[str, typing.Optional[str]]],
+            concurrency: int = config.settings.hh.discard_concurrency
+    ) -> typing.List[ActionResult]:
+        """Discard (negotiation id, candidate name) pairs with the discard letter.
+
+        Up to `concurrency` discards are in flight at once (the rate limiter
+        still applies). A failed item does not stop the others; the results
+        are in the order of `items`.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def discard(nid: str, name: typing.Optional[str]) -> ActionResult:
+            async with semaphore:
+                return await self.discard_negotiation(nid, name)
+
+        return list(await asyncio.gather(*(discard(nid, name) for nid, name in items)))
+
     async def negotiation_message(
             self,
             nid: str,
@@ -235,24 +324,14 @@ class HeadHunter(BaseApi):
             self,
             parameter_name: str
     ) -> typing.Optional[ItemDirectories]:
-        
-        url = self.url.format(method='dictionaries')
-        result = await self.request_session(
-            method=MethodRequest.get,
-            url=url,
-            json_status=True,
-            answer_log=False,
-            
-        )
-        logging.info(result)
-        items = ItemDirectories()
-        for i in result.get(parameter_name):
-            d = Directories()
-            d.id = i.get('id')
-            d.name = i.get('name')
-            items.append_item(d)
+        return await self.dictionaries.get(self, parameter_name)
 
-        return items
+    async def get_reference(
+            self,
+            name: str
+    ):
+        """Cached roles, templates, address, managers or areas (see ReferenceCache.sources)."""
+        return await self.reference.get(self, name)
 
     async def get_areas(
             self,
@@ -461,7 +540,12 @@ class HeadHunter(BaseApi):
     async def get_resumes(
             self,
             resume_id: str
-    ) -> typing.Tuple[Contacts, str] | typing.Tuple[None, None]:
+    ) -> typing.Tuple[Contacts, ResumeFile] | typing.Tuple[None, None]:
+        """Contacts and the PDF of a resume.
+
+        The returned ResumeFile is owned by the caller and should be closed
+        (or used as a context manager) once it has been consumed.
+        """
         url = self.url.format(method=f'resumes/{resume_id}')
         result = await self.request_session(
             method=MethodRequest.get,
@@ -470,29 +554,25 @@ class HeadHunter(BaseApi):
             answer_log=False,
             # # headers=headers,
         )
-        contact = Contacts()
-        if result.get('birth_date'):
-            contact.birth_date = result.get('birth_date')
-        if result.get('contact'):
-            if len(result.get('contact')) < 2:
-                result.get('contact').append({'value': None})
-            #print(result.get('contact'))
-            if result.get('contact')[1].get('value'):
-                contact.email = result.get('contact')[1].get('value')
-            if result.get('contact')[0].get('value'):
-                contact.phone = result.get('contact')[0].get('value').get('country') + result.get('contact')[0].get('value').get('city') + result.get('contact')[0].get('value').get('number')
+        contact = decode_contacts(result) or Contacts()
+        pdf_url = resume_pdf_url(result or {})
+        if not pdf_url:
+            logging.info(f"Resume {resume_id} has no PDF to download")
+            return None, None
 
         response = await self.request_session(
             method=MethodRequest.get,
-            url=result.get('actions').get("download").get('pdf').get('url'),
+            url=pdf_url,
             json_status=True,
             answer_log=False,
-            is_file=True
+            is_file=True,
+            # The url holds the candidate's name: not a metrics label
+            trace_request_ctx={'endpoint': '/resumes/{id}/pdf'}
             # # headers=headers,
         )
         #print(result.get('actions').get("download").get('pdf'))
-        if response.get('file_path', None):
-            return contact, response.get('file_path')
+        if response and response.get('file', None):
+            return contact, response.get('file')
         return None, None
 
     async def archive_vacancies(
@@ -1,12 +1,16 @@
-import json
 import logging
 import typing
-import os
 
 import aiohttp
-import requests
-from oauthlib.oauth2 import WebApplicationClient
 from API import config
+from API.lib.hh.decoder import loads
+from API.lib.hh.files import ResumeFile
+from API.lib.hh.limiter import RateLimiter, hh_limiter, parse_retry_after
+from API.lib.hh.token import TokenManager, TokenState, hh_tokens
+from API.lib.metrics import trace_config
+from API.lib.redact import Redacted
+from API.lib.resilience import TRANSIENT_ERRORS, CircuitBreaker, RetryPolicy, UpstreamUnavailable
+from API.lib.session import SessionPool
 
 
 class MethodRequest:
@@ -25,6 +29,11 @@ def to_format(
     return data
 
 
+hh_session_pool = SessionPool.from_settings('hh', config.settings.hh, trace_configs=[trace_config('hh')])
+hh_retry_policy = RetryPolicy.from_settings(config.settings.hh)
+hh_breaker = CircuitBreaker.from_settings('hh', config.settings.hh)
+
+
 class BaseApi:
 
     def __init__(
@@ -35,31 +44,50 @@ class BaseApi:
             client_secret: str = config.CLIENT_SECRET,
             employer_id: str = config.EMPLOYER_ID,
             manager_id: str = config.MANAGER_ID,
-            ref_token: str = None
+            ref_token: str = None,
+            session_pool: SessionPool = hh_session_pool,
+            tokens: TokenManager = hh_tokens,
+            limiter: RateLimiter = hh_limiter,
+            throttle_retries: int = config.settings.hh.throttle_retries,
+            retry_policy: RetryPolicy = hh_retry_policy,
+            breaker: CircuitBreaker = hh_breaker
     ):
-        self.client = WebApplicationClient(client_id)
-        self.production_url = "https://api.hh.kz/{method}"
-        self.token_url = 'https://hh.ru/oauth/token'
+        self.production_url = config.settings.hh.api_url
+        self.session_pool = session_pool
+        self.limiter = limiter
+        self.throttle_retries = throttle_retries
+        self.retry_policy = retry_policy
+        self.breaker = breaker
         self.user_id = user_id
-        self.ref_token = ref_token
-        self.basic_token = basic_token
+        if basic_token or ref_token:
+            # Explicit tokens get their own manager, detached from the tokens table
+            tokens = TokenManager(
+                client_id=client_id,
+                state=TokenState(access_token=basic_token, refresh_token=ref_token)
+            )
+        self.tokens = tokens
         # self.client_secret =
 
-    def get_token(self):
-        return self.basic_token
-
-    def get_refresh_token(
-            self
-    ):
-        response = requests.post(self.token_url, params=self.client.prepare_refresh_body(
-            refresh_token=self.ref_token
-        ))
-        return response.json()
+    def get_token(self) -> typing.Optional[str]:
+        if self.tokens.state is None:
+            return None
+        return self.tokens.state.access_token
 
     @property
     def url(self) -> str:
         return self.production_url
 
+    @staticmethod
+    async def is_token_rejected(
+            response: aiohttp.ClientResponse
+    ) -> bool:
+        if response.status == 401:
+            return True
+        if response.status == 403:
+            # HH answers 403 with an "oauth" error for expired or revoked tokens
+            return b'"oauth"' in await response.read()
+        return False
+
     async def request_session(
             self,
             method: MethodRequest.get,
@@ -70,54 +98,101 @@ class BaseApi:
             **kwargs
 
     ):
-        result = self.get_refresh_token()
-        if result.get('access_token'):
-            self.basic_token = result.get('access_token')
-            self.ref_token = result.get('refresh_token')
         # print(
         #     f"METHOD {method}\nURL - {url}\n"
         #     f"dict - > {kwargs}")
-        logging.info(
-            f"METHOD {method}\nURL - {url}\n"
-            f"dict - > {kwargs}"
-        )
-
-        async with aiohttp.ClientSession() as session:
+        logging.info("METHOD %s\nURL - %s\ndict - > %s", method, url, Redacted(kwargs))
+
+        session = await self.session_pool.get()
+        token = await self.tokens.get_access_token(self.session_pool)
+        extra_headers = kwargs.pop('headers', None) or {}
+        token_refreshed = False
+        throttled = 0
+        retry = self.retry_policy.start(method, self.breaker)
+        while True:
+            self.breaker.before_request()
+            await self.limiter.acquire()
             headers = {
-                'Authorization': 'Bearer {}'.format(self.basic_token)
+                **extra_headers,
+                'Authorization': 'Bearer {}'.format(token)
             }
-            response = await session.request(
-                method=method,
-                url=url,
-                headers=headers,
-                **kwargs
-            )
-            # print(await response.text())
-            if response.status == 400 and self.user_id:
-                # print(response.status)
-                res = await response.read()
-                logging.info(res)
-                # print(json.loads(res))
-                return
-
             try:
-                if is_file:
-                    with open('resume.pdf', 'wb') as file:
-                        file.write(await response.read())
-                    return {
-                        "status_code": '200',
-                        'file_path': os.path.abspath('resume.pdf')
-                    }
-                if json_status:
-                    data = await response.read()
-                    data = json.loads(data)
-                    return data
-            except Exception as e:
-                logging.exception(e)
-            finally:
-                if answer_log:
-                    logging.info(
-                        f'ANSWER: {await response.text()}'
-                    )
-
-            return response
+                async with session.request(
+                        method=method,
+                        url=url,
+                        headers=headers,
+                        timeout=retry.timeout(session.timeout),
+                        **kwargs
+                ) as response:
+                    if response.status == 429:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                        # The limiter slows down and holds every HH call for Retry-After
+                        self.limiter.on_throttled(retry_after)
+                        # Neither a success nor a failure of the host: a half-open
+                        # probe gives its slot back for the retry
+                        self.breaker.release()
+                        if throttled < self.throttle_retries:
+                            throttled += 1
+                            continue
+                        logging.info(f"HH throttled {method} {url}, giving up after {throttled} retries")
+                        raise UpstreamUnavailable('hh', response.status, retry_after)
+                    self.limiter.on_success()
+
+                    if response.status in self.retry_policy.statuses:
+                        logging.info(f"HH answered {response.status} for {method} {url}: {await response.text()}")
+                        if await retry.backoff(response.status):
+                            continue
+                        raise UpstreamUnavailable('hh', response.status)
+                    self.breaker.record_success()
+
+                    if not token_refreshed and await self.is_token_rejected(response):
+                        logging.info(f"HH rejected the token with status {response.status}")
+                        token_refreshed = True
+                        token = await self.tokens.refresh(self.session_pool, stale_token=token)
+                        continue
+                    return await self.read_response(response, is_file, json_status, answer_log)
+            except TRANSIENT_ERRORS as e:
+                logging.info(f"HH request {method} {url} failed: {e!r}")
+                if await retry.backoff(e):
+                    continue
+                raise
+
+    async def read_response(
+            self,
+            response: aiohttp.ClientResponse,
+            is_file: bool,
+            json_status: bool,
+            answer_log: bool
+    ):
+        # print(await response.text())
+        if response.status == 400 and self.user_id:
+            # print(response.status)
+            res = await response.read()
+            logging.info(res)
+            # print(json.loads(res))
+            return
+
+        try:
+            if is_file:
+                return {
+                    "status_code": '200',
+                    'file': await ResumeFile.download(response)
+                }
+            if json_status:
+                data = await response.read()
+                data = loads(data)
+                return data
+        except TRANSIENT_ERRORS:
+            # The body was cut off: let request_session retry the request
+            raise
+        except Exception as e:
+            logging.exception(e)
+        finally:
+            if answer_log:
+                logging.info(
+                    f'ANSWER: {await response.text()}'
+                )
+
+        # Read the body so the connection goes back to the pool
+        await response.read()
+        return response
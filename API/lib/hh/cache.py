@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import time
+import typing
+from dataclasses import dataclass
+
+from API import config
+from API.lib.hh.base import MethodRequest
+from API.lib.resilience import UpstreamUnavailable
+from API.lib.schemas.address import ItemsAddress
+from API.lib.schemas.base import BaseModel
+from API.lib.schemas.categories import ItemsCategories
+from API.lib.schemas.directories import Directories, ItemDirectories
+from API.lib.schemas.manager import ItemsManager
+from API.lib.schemas.resume import ItemAreas
+from API.lib.schemas.templates import ItemsTemplate
+
+__all__ = ("DictionaryCache", "hh_dictionaries",
+           "ReferenceSnapshot", "ReferenceStorage", "ReferenceCache", "hh_reference", )
+
+
+class DictionaryCache:
+    """In-memory copy of HH /dictionaries shared by every HeadHunter instance.
+
+    The whole document is downloaded once and every key is parsed into
+    ItemDirectories. After `ttl` seconds the copy is revalidated with a
+    conditional request (ETag / Last-Modified), so an unchanged document
+    costs a 304 without a body.
+    """
+
+    def __init__(
+            self,
+            ttl: float = config.settings.hh.dictionaries_ttl
+    ):
+        self.ttl = ttl
+        self.items: typing.Dict[str, ItemDirectories] = {}
+        self.etag: typing.Optional[str] = None
+        self.last_modified: typing.Optional[str] = None
+        self.fetched_at: typing.Optional[float] = None
+        self._lock: typing.Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def is_fresh(self) -> bool:
+        return self.fetched_at is not None and time.monotonic() - self.fetched_at < self.ttl
+
+    def invalidate(self):
+        self.fetched_at = None
+
+    @staticmethod
+    def parse(
+            result: dict
+    ) -> typing.Dict[str, ItemDirectories]:
+        parsed = {}
+        for key, values in result.items():
+            if not isinstance(values, list):
+                continue
+            items = ItemDirectories()
+            items.data = []
+            for i in values:
+                if not isinstance(i, dict):
+                    continue
+                items.append_item(
+                    Directories(
+                        id=i.get('id'),
+                        name=i.get('name')
+                    )
+                )
+            parsed[key] = items
+        return parsed
+
+    async def revalidate(
+            self,
+            api
+    ):
+        headers = {}
+        if self.items:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+        try:
+            response = await api.request_session(
+                method=MethodRequest.get,
+                url=api.url.format(method='dictionaries'),
+                json_status=False,
+                answer_log=False,
+                headers=headers
+            )
+        except UpstreamUnavailable as e:
+            logging.info(f"HH dictionaries were not fetched: {e}")
+            return
+        if response is None or (response.status != 304 and response.status >= 400):
+            # Keep serving the previous copy, if any, and retry on the next lookup
+            logging.info(f"HH dictionaries were not fetched: {getattr(response, 'status', None)}")
+            return
+
+        if response.status != 304:
+            self.items = self.parse(await response.json(content_type=None))
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+            logging.info(f"HH dictionaries fetched: {len(self.items)} keys")
+        self.fetched_at = time.monotonic()
+
+    async def get(
+            self,
+            api,
+            parameter_name: str
+    ) -> typing.Optional[ItemDirectories]:
+        if not self.is_fresh():
+            async with self.lock:
+                if not self.is_fresh():
+                    await self.revalidate(api)
+        return self.items.get(parameter_name)
+
+
+hh_dictionaries = DictionaryCache()
+
+
+@dataclass
+class ReferenceSnapshot:
+    name: str
+    payload: dict
+    # Unix time of the fetch, so that the age survives a restart
+    fetched_at: float
+
+
+class ReferenceStorage(typing.Protocol):
+    async def load_all(self) -> typing.List[ReferenceSnapshot]:
+        ...
+
+    async def save(self, snapshot: ReferenceSnapshot) -> None:
+        ...
+
+
+@dataclass
+class ReferenceEntry:
+    value: typing.Optional[BaseModel] = None
+    fetched_at: typing.Optional[float] = None
+
+
+class ReferenceCache:
+    """Employer reference data (roles, templates, addresses, managers, areas).
+
+    Values are served from memory; a value older than `ttl` is still
+    returned while a background task fetches a new one. Every fetched value
+    is written to the storage, so a restarted worker starts warm from the
+    last snapshot instead of calling HH.
+    """
+
+    # name -> (HeadHunter method, collection model)
+    sources: typing.Dict[str, typing.Tuple[str, typing.Type[BaseModel]]] = {
+        'roles': ('get_roles', ItemsCategories),
+        'templates': ('get_brand_templates', ItemsTemplate),
+        'address': ('get_address', ItemsAddress),
+        'managers': ('get_managers', ItemsManager),
+        'areas': ('get_areas', ItemAreas),
+    }
+
+    def __init__(
+            self,
+            ttl: float = config.settings.hh.reference_ttl,
+            storage: typing.Optional[ReferenceStorage] = None
+    ):
+        self.ttl = ttl
+        self.storage = storage
+        self.entries: typing.Dict[str, ReferenceEntry] = {
+            name: ReferenceEntry() for name in self.sources
+        }
+        self._tasks: typing.Dict[str, asyncio.Task] = {}
+
+    def is_stale(self, name: str) -> bool:
+        entry = self.entries[name]
+        return entry.fetched_at is None or time.time() - entry.fetched_at >= self.ttl
+
+    async def warm_up(self):
+        if self.storage is None:
+            return
+        for snapshot in await self.storage.load_all():
+            if snapshot.name not in self.sources:
+                continue
+            _, model = self.sources[snapshot.name]
+            entry = self.entries[snapshot.name]
+            entry.value = model().load(snapshot.payload)
+            entry.fetched_at = snapshot.fetched_at
+            logging.info(f"HH reference data '{snapshot.name}' restored from snapshot")
+
+    async def _fetch(
+            self,
+            api,
+            name: str
+    ):
+        method, _ = self.sources[name]
+        try:
+            value = await getattr(api, method)()
+        except Exception as e:
+            logging.exception(e)
+            return
+        if value is None:
+            logging.info(f"HH reference data '{name}' was not fetched")
+            return
+
+        entry = self.entries[name]
+        entry.value = value
+        entry.fetched_at = time.time()
+        logging.info(f"HH reference data '{name}' refreshed")
+        if self.storage is not None:
+            try:
+                await self.storage.save(
+                    ReferenceSnapshot(name=name, payload=value.dict(), fetched_at=entry.fetched_at)
+                )
+            except Exception as e:
+                logging.exception(e)
+
+    def _start_refresh(
+            self,
+            api,
+            name: str
+    ) -> asyncio.Task:
+        task = self._tasks.get(name)
+        if task is None or task.done():
+            task = asyncio.create_task(self._fetch(api, name))
+            self._tasks[name] = task
+        return task
+
+    async def refresh(
+            self,
+            api,
+            name: str
+    ) -> typing.Optional[BaseModel]:
+        """Fetch `name` now, joining a refresh that is already running."""
+        await asyncio.shield(self._start_refresh(api, name))
+        return self.entries[name].value
+
+    async def refresh_all(
+            self,
+            api
+    ) -> typing.Dict[str, ReferenceEntry]:
+        await asyncio.gather(*(self.refresh(api, name) for name in self.sources))
+        return self.entries
+
+    async def get(
+            self,
+            api,
+            name: str
+    ) -> typing.Optional[BaseModel]:
+        entry = self.entries[name]
+        if entry.value is None:
+            return await self.refresh(api, name)
+        if self.is_stale(name):
+            self._start_refresh(api, name)
+        return entry.value
+
+
+hh_reference = ReferenceCache()
@@ -0,0 +1,166 @@
+"""
+Decoders of HH payloads into the API.lib.schemas dataclasses.
+"""
+import dataclasses
+import typing
+
+import orjson
+
+from API.lib.schemas.resume import Areas, Contacts, Resume
+from API.lib.schemas.vacation import Vacation, VacationItems
+
+__all__ = ("loads", "compile_decoder", "decode_resume", "decode_negotiation",
+           "decode_negotiations", "decode_contacts", "resume_pdf_url", )
+
+
+def loads(data: bytes | str) -> typing.Any:
+    return orjson.loads(data)
+
+
+def _schema_type(hint) -> typing.Tuple[typing.Optional[type], bool]:
+    """(dataclass, is_list) for a field annotation, or (None, False) for plain values."""
+    origin = typing.get_origin(hint)
+    args = typing.get_args(hint)
+    if origin in (list, typing.List) and args:
+        item, _ = _schema_type(args[0])
+        return item, item is not None
+    if origin is typing.Union or (origin is not None and type(None) in args):
+        for arg in args:
+            if dataclasses.is_dataclass(arg):
+                return arg, False
+        return None, False
+    if dataclasses.is_dataclass(hint):
+        return hint, False
+    return None, False
+
+
+def compile_decoder(
+        cls: type,
+        overrides: typing.Dict[str, typing.Callable] = None,
+        computed: typing.Dict[str, typing.Callable] = None,
+        skip: typing.Dict[type, typing.Collection[str]] = None,
+        _decoders: typing.Dict[type, typing.Callable] = None
+) -> typing.Callable[[typing.Optional[dict]], typing.Any]:
+    """Generate `decode(dict) -> cls` from the fields of the dataclass `cls`.
+
+    `overrides` maps a field name to a callable receiving the raw value,
+    `computed` to a callable receiving the whole payload. Fields listed in
+    `skip` for a class (nested classes included) keep their default.
+    """
+    overrides = overrides or {}
+    computed = computed or {}
+    skip = skip or {}
+    decoders = {} if _decoders is None else _decoders
+    if cls in decoders and not overrides and not computed:
+        return decoders[cls]
+
+    namespace = {'cls': cls}
+    hints = typing.get_type_hints(cls)
+    arguments = []
+    for field in dataclasses.fields(cls):
+        name = field.name
+        if name in skip.get(cls, ()):
+            if field.default_factory is not dataclasses.MISSING:
+                namespace[f'default_{name}'] = field.default_factory
+                arguments.append(f"default_{name}()")
+            else:
+                namespace[f'default_{name}'] = None if field.default is dataclasses.MISSING else field.default
+                arguments.append(f"default_{name}")
+            continue
+        if name in computed:
+            namespace[f'compute_{name}'] = computed[name]
+            arguments.append(f"compute_{name}(data)")
+            continue
+        if name in overrides:
+            namespace[f'override_{name}'] = overrides[name]
+            arguments.append(f"override_{name}(get({name!r}))")
+            continue
+        schema, is_list = _schema_type(hints[name])
+        if schema is None:
+            arguments.append(f"get({name!r})")
+            continue
+        namespace[f'decode_{name}'] = compile_decoder(schema, skip=skip, _decoders=decoders)
+        if is_list:
+            arguments.append(
+                f"[decode_{name}(item) for item in value] "
+                f"if (value := get({name!r})) else None"
+            )
+        else:
+            arguments.append(f"decode_{name}(get({name!r}))")
+
+    # Arguments are positional, in field order: cheaper than keywords
+    source = (
+        f"def decode_{cls.__name__}(data):\n"
+        f"    if not data:\n"
+        f"        return None\n"
+        f"    get = data.get\n"
+        f"    return cls(\n        " + ",\n        ".join(arguments) + "\n    )\n"
+    )
+    exec(compile(source, f"<decoder {cls.__name__}>", "exec"), namespace)
+    decoder = namespace[f'decode_{cls.__name__}']
+    if not overrides and not computed:
+        decoders[cls] = decoder
+    return decoder
+
+
+# Fields the hand-written parsers never filled in: left out so that the
+# objects are the same as before
+_NEGOTIATION_SKIP = {
+    Resume: ('certificate', 'url', 'education'),
+    Areas: ('parent_id', ),
+}
+
+decode_resume = compile_decoder(Resume, skip=_NEGOTIATION_SKIP)
+decode_negotiation = compile_decoder(
+    Vacation,
+    overrides={'resume': decode_resume}
+)
+
+
+def _contact_values(data: dict) -> list:
+    # HH lists the phone first and the email second
+    return [c.get('value') if isinstance(c, dict) else None for c in data.get('contact') or ()]
+
+
+def _contact_phone(data: dict) -> typing.Optional[str]:
+    values = _contact_values(data)
+    phone = values[0] if values else None
+    if not isinstance(phone, dict):
+        return None
+    return ''.join(phone.get(part) or '' for part in ('country', 'city', 'number')) or None
+
+
+def _contact_email(data: dict) -> typing.Optional[str]:
+    values = _contact_values(data)
+    return values[1] if len(values) > 1 and values[1] else None
+
+
+decode_contacts = compile_decoder(
+    Contacts,
+    computed={'email': _contact_email, 'phone': _contact_phone},
+    skip={Contacts: ('pdf', )}
+)
+
+
+def resume_pdf_url(data: dict) -> typing.Optional[str]:
+    """Download url of the PDF from a resumes/{id} payload."""
+    pdf = ((data.get('actions') or {}).get('download') or {}).get('pdf') or {}
+    return pdf.get('url')
+
+
+def decode_negotiations(
+        body: bytes | str | dict,
+        vacations: VacationItems = None
+) -> VacationItems:
+    """Decode a negotiations/response page and append it to `vacations`."""
+    result = loads(body) if isinstance(body, (bytes, str)) else body
+    if vacations is None:
+        vacations = VacationItems()
+    vacations.found = result.get('found')
+    vacations.pages = result.get('pages')
+    items = result.get('items')
+    if items:
+        if vacations.data is None:
+            vacations.data = []
+        vacations.data.extend(decode_negotiation(i) for i in items)
+    return vacations
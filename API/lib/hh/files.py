@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import typing
+from pathlib import Path
+
+import aiohttp
+
+from API import config
+
+__all__ = ("ResumeFile", "FileStore", "CHUNK_SIZE", )
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ResumeFile:
+    """A downloaded resume, private to one request.
+
+    The content stays in memory up to `max_memory` bytes and rolls over to
+    an anonymous temporary file above it. The storage disappears when the
+    handle is closed (or garbage collected), so concurrent downloads never
+    share a path and nothing is left in the working directory.
+    """
+
+    def __init__(
+            self,
+            name: str = 'resume.pdf',
+            max_memory: int = config.settings.hh.file_memory_limit
+    ):
+        self.name = name
+        self.size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_memory, suffix='.pdf')
+
+    @classmethod
+    async def download(
+            cls,
+            response: aiohttp.ClientResponse,
+            name: str = 'resume.pdf'
+    ) -> 'ResumeFile':
+        resume_file = cls(name=name)
+        try:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                resume_file.write(chunk)
+        except BaseException:
+            resume_file.close()
+            raise
+        resume_file.file.seek(0)
+        return resume_file
+
+    @classmethod
+    def from_path(
+            cls,
+            path: typing.Union[str, Path],
+            name: str = 'resume.pdf'
+    ) -> 'ResumeFile':
+        """A read-only handle on a file that is already on disk."""
+        resume_file = cls.__new__(cls)
+        resume_file.name = name
+        resume_file.file = open(path, 'rb')
+        resume_file.size = os.fstat(resume_file.file.fileno()).st_size
+        return resume_file
+
+    def write(self, chunk: bytes):
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def iter_chunks(
+            self,
+            size: int = CHUNK_SIZE
+    ) -> typing.Iterator[bytes]:
+        self.file.seek(0)
+        while chunk := self.file.read(size):
+            yield chunk
+
+    @property
+    def in_memory(self) -> bool:
+        return not getattr(self.file, '_rolled', True)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self) -> 'ResumeFile':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FileStore:
+    """Content-addressed files on disk: a file is stored under its SHA-256.
+
+    The same content is kept once whoever stores it. Files not used for
+    `ttl` seconds are removed by `evict`, then the least recently used ones
+    until the store fits in `max_bytes`. The methods do blocking I/O, call
+    them in a thread.
+    """
+
+    def __init__(
+            self,
+            root: typing.Union[str, Path],
+            max_bytes: int,
+            ttl: float,
+            suffix: str = '.pdf'
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.suffix = suffix
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}{self.suffix}"
+
+    def put(self, resume_file: ResumeFile) -> typing.Tuple[str, int]:
+        """Store the content of `resume_file`, return (digest, size)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        sha256 = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.root, suffix='.tmp', delete=False) as tmp:
+            try:
+                for chunk in resume_file.iter_chunks():
+                    sha256.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+        resume_file.file.seek(0)
+
+        digest = sha256.hexdigest()
+        path = self.path(digest)
+        path.parent.mkdir(exist_ok=True)
+        # Atomic: a concurrent reader sees the whole file or no file
+        os.replace(tmp.name, path)
+        return digest, size
+
+    def open(
+            self,
+            digest: str,
+            name: str = 'resume.pdf'
+    ) -> typing.Optional[ResumeFile]:
+        path = self.path(digest)
+        try:
+            resume_file = ResumeFile.from_path(path, name=name)
+        except FileNotFoundError:
+            return None
+        # The modification time is the last use, for the eviction
+        os.utime(path)
+        return resume_file
+
+    def evict(self) -> int:
+        """Remove expired and least recently used files, return how many."""
+        if not self.root.exists():
+            return 0
+        now = time.time()
+        files = []
+        for path in self.root.glob(f'*/*{self.suffix}'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        removed = 0
+        total = sum(size for _, size, _ in files)
+        for used_at, size, path in sorted(files):
+            if now - used_at < self.ttl and total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        if removed:
+            logging.info(f"File store {self.root}: {removed} files evicted, {total} bytes left")
+        return removed
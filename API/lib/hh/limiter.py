@@ -0,0 +1,146 @@
+import asyncio
+import datetime
+import email.utils
+import enum
+import heapq
+import itertools
+import logging
+import time
+import typing
+from contextvars import ContextVar
+
+from API import config
+
+__all__ = ("Priority", "request_priority", "parse_retry_after", "RateLimiter", "hh_limiter", )
+
+
+class Priority(enum.IntEnum):
+    interactive = 0
+    background = 1
+
+
+# Background jobs set Priority.background for the whole task, so that the
+# calls of an endpoint go first when both wait for the same budget
+request_priority: ContextVar[Priority] = ContextVar('hh_request_priority', default=Priority.interactive)
+
+
+def parse_retry_after(
+        value: typing.Optional[str]
+) -> typing.Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((date - datetime.datetime.now(date.tzinfo)).total_seconds(), 0.0)
+
+
+class RateLimiter:
+    """Token bucket shared by every outbound HH request of the process.
+
+    The refill rate adapts AIMD-style: it grows by `increase` per successful
+    response up to `max_rate` and is halved on every 429, when the bucket is
+    also paused for Retry-After. Waiting requests are served by priority,
+    then in arrival order.
+    """
+
+    def __init__(
+            self,
+            max_rate: float = config.settings.hh.rate_limit,
+            burst: int = config.settings.hh.rate_burst,
+            min_rate: float = config.settings.hh.rate_min,
+            increase: float = 0.1,
+            decrease: float = 0.5,
+            default_pause: float = 1.0
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.default_pause = default_pause
+        self.tokens = float(burst)
+        self.paused_until = 0.0
+        self.updated_at = time.monotonic()
+        self._waiters: typing.List[typing.Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: typing.Optional[asyncio.Event] = None
+        self._pump: typing.Optional[asyncio.Task] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _delay(self) -> float:
+        """Seconds until a token can be handed out, 0 if one is available."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(
+            self,
+            priority: typing.Optional[Priority] = None
+    ):
+        if priority is None:
+            priority = request_priority.get()
+        if not self._waiters and self._delay() == 0.0:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+        if self._pump is None or self._pump.done():
+            self._wakeup = asyncio.Event()
+            self._pump = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self):
+        while self._waiters:
+            delay = self._delay()
+            if delay > 0:
+                # A 429 may extend the pause while waiting, so re-check after it
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # The waiter was cancelled, keep the token
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttled(
+            self,
+            retry_after: typing.Optional[float] = None
+    ):
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        pause = retry_after if retry_after is not None else self.default_pause
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        self.tokens = min(self.tokens, 0.0)
+        logging.info(f"HH throttled: rate {self.rate:.2f}/s, pause {pause:.1f}s")
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+
+hh_limiter = RateLimiter()
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import typing
+from dataclasses import dataclass
+
+from API import config
+from API.lib.hh.files import FileStore, ResumeFile
+from API.lib.schemas.resume import Contacts, Resume
+
+__all__ = ("CachedResume", "ResumeCacheStorage", "ResumeCache", "hh_resume_cache", )
+
+
+@dataclass
+class CachedResume:
+    resume_id: str
+    # HH `updated_at` of the resume the entry was fetched for
+    updated_at: typing.Optional[str] = None
+    contacts: typing.Optional[dict] = None
+    pdf_hash: typing.Optional[str] = None
+    pdf_size: typing.Optional[int] = None
+    bitrix_contact_id: typing.Optional[str] = None
+
+
+class ResumeCacheStorage(typing.Protocol):
+    async def get(self, resume_id: str) -> typing.Optional[CachedResume]:
+        ...
+
+    async def save(self, entry: CachedResume) -> None:
+        ...
+
+    async def set_bitrix_contact(self, resume_id: str, contact_id: str) -> None:
+        ...
+
+
+class ResumeCache:
+    """Contacts, PDF and Bitrix contact of resumes already fetched from HH.
+
+    A candidate responding to several vacancies costs one resume view: the
+    entry is reused while the `updated_at` of the resume in the negotiation
+    matches the cached one. The PDF is kept in a content-addressed file
+    store; an evicted PDF is fetched again with the resume. The Bitrix
+    contact survives resume updates. Without a storage nothing is cached.
+    """
+
+    def __init__(
+            self,
+            files: FileStore,
+            storage: typing.Optional[ResumeCacheStorage] = None
+    ):
+        self.files = files
+        self.storage = storage
+
+    async def get(
+            self,
+            resume: Resume
+    ) -> typing.Optional[CachedResume]:
+        """The entry of `resume`, also when it is outdated (see `is_current`)."""
+        if self.storage is None or not resume.id:
+            return None
+        try:
+            return await self.storage.get(resume.id)
+        except Exception as e:
+            logging.exception(e)
+            return None
+
+    @staticmethod
+    def is_current(
+            entry: typing.Optional[CachedResume],
+            resume: Resume
+    ) -> bool:
+        return (
+            entry is not None
+            and entry.contacts is not None
+            and entry.pdf_hash is not None
+            and entry.updated_at == resume.updated_at
+        )
+
+    async def load(
+            self,
+            entry: CachedResume
+    ) -> typing.Tuple[typing.Optional[Contacts], typing.Optional[ResumeFile]]:
+        resume_file = await asyncio.to_thread(self.files.open, entry.pdf_hash)
+        if resume_file is None:
+            return None, None
+        return Contacts().load(entry.contacts), resume_file
+
+    async def save(
+            self,
+            resume: Resume,
+            contacts: Contacts,
+            resume_file: ResumeFile,
+            entry: typing.Optional[CachedResume] = None
+    ):
+        if self.storage is None:
+            return
+        try:
+            pdf_hash, pdf_size = await asyncio.to_thread(self.files.put, resume_file)
+            await self.storage.save(
+                CachedResume(
+                    resume_id=resume.id,
+                    updated_at=resume.updated_at,
+                    contacts=contacts.dict(),
+                    pdf_hash=pdf_hash,
+                    pdf_size=pdf_size,
+                    bitrix_contact_id=entry.bitrix_contact_id if entry else None
+                )
+            )
+        except Exception as e:
+            logging.exception(e)
+
+    async def set_bitrix_contact(
+            self,
+            resume_id: str,
+            contact_id: typing.Optional[str]
+    ):
+        if self.storage is None or not contact_id:
+            return
+        try:
+            await self.storage.set_bitrix_contact(resume_id, str(contact_id))
+        except Exception as e:
+            logging.exception(e)
+
+    async def evict(self) -> int:
+        return await asyncio.to_thread(self.files.evict)
+
+
+hh_resume_cache = ResumeCache(
+    files=FileStore(
+        root=config.settings.hh.resume_cache_dir,
+        max_bytes=config.settings.hh.resume_cache_max_bytes,
+        ttl=config.settings.hh.resume_cache_ttl
+    )
+)
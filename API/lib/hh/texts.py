@@ -0,0 +1,13 @@
+# Messages sent to candidates together with a negotiation state change
+
+DISCARD_MESSAGE = '''{name} здравствуйте!
+
+Большое спасибо за интерес к вакансии! К сожалению, сейчас мы не готовы пригласить вас на следующий этап.
+Ценим ваше внимание и будем рады получать ваши отклики на другие позиции.
+
+Дюсембаева Акмарал Бакытовна
+'''
+
+
+def discard_message(name: str | None) -> str:
+    return DISCARD_MESSAGE.format(name=name or '')
@@ -0,0 +1,151 @@
+import asyncio
+import datetime
+import functools
+import logging
+import typing
+from dataclasses import dataclass
+
+from oauthlib.oauth2 import WebApplicationClient
+
+from API import config
+from API.lib.session import SessionPool
+
+__all__ = ("TokenState", "TokenStorage", "TokenManager", "hh_tokens", )
+
+
+@dataclass
+class TokenState:
+    access_token: typing.Optional[str] = None
+    refresh_token: typing.Optional[str] = None
+    # None means "unknown": the token is used until HH rejects it
+    expires_at: typing.Optional[datetime.datetime] = None
+    # Incremented by the storage on every refresh, shared by all processes
+    version: int = 0
+
+
+Refresher = typing.Callable[[TokenState], typing.Awaitable[typing.Optional[TokenState]]]
+
+
+class TokenStorage(typing.Protocol):
+    async def load(self) -> typing.Optional[TokenState]:
+        ...
+
+    async def exchange(
+            self,
+            stale: TokenState,
+            refresher: Refresher
+    ) -> typing.Optional[TokenState]:
+        """Refresh `stale` with `refresher` while other processes wait.
+
+        Returns the stored token instead if another process has already
+        replaced `stale`, or None when the refresh failed.
+        """
+        ...
+
+
+class TokenManager:
+    """Keeps the HeadHunter OAuth token of the process in memory.
+
+    The token is refreshed only when it is about to expire or after HH
+    rejected it. Concurrent callers wait for the single in-flight refresh
+    instead of starting their own. With a storage the refresh is also
+    coordinated between processes: one of them refreshes, the others pick
+    up the stored token.
+    """
+
+    def __init__(
+            self,
+            client_id: str = config.CLIENT_ID,
+            token_url: str = config.settings.hh.token_url,
+            refresh_margin: datetime.timedelta = datetime.timedelta(minutes=5),
+            storage: typing.Optional[TokenStorage] = None,
+            state: typing.Optional[TokenState] = None
+    ):
+        self.client = WebApplicationClient(client_id)
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        self.storage = storage
+        self.state = state
+        self._lock: typing.Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created lazily so that the lock belongs to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def is_expiring(self) -> bool:
+        if self.state is None or self.state.expires_at is None:
+            return False
+        return datetime.datetime.now() >= self.state.expires_at - self.refresh_margin
+
+    async def load(self) -> TokenState:
+        if self.state is None:
+            async with self.lock:
+                if self.state is None and self.storage is not None:
+                    self.state = await self.storage.load()
+                if self.state is None:
+                    self.state = TokenState()
+        return self.state
+
+    async def get_access_token(
+            self,
+            session_pool: SessionPool
+    ) -> typing.Optional[str]:
+        state = await self.load()
+        if self.is_expiring():
+            return await self.refresh(session_pool, stale_token=state.access_token)
+        return state.access_token
+
+    async def refresh(
+            self,
+            session_pool: SessionPool,
+            stale_token: typing.Optional[str]
+    ) -> typing.Optional[str]:
+        """Refresh the token unless another caller already replaced `stale_token`."""
+        async with self.lock:
+            if self.state.access_token != stale_token:
+                return self.state.access_token
+
+            refresher = functools.partial(self.request_token, session_pool)
+            if self.storage is not None:
+                new_state = await self.storage.exchange(self.state, refresher)
+            else:
+                new_state = await refresher(self.state)
+
+            if new_state is None:
+                # HH refuses to refresh a token that has not expired yet,
+                # so wait for it to be rejected before trying again
+                self.state.expires_at = None
+            else:
+                self.state = new_state
+            return self.state.access_token
+
+    async def request_token(
+            self,
+            session_pool: SessionPool,
+            state: TokenState
+    ) -> typing.Optional[TokenState]:
+        session = await session_pool.get()
+        body = self.client.prepare_refresh_body(refresh_token=state.refresh_token)
+        async with session.post(self.token_url, params=body) as response:
+            result = await response.json(content_type=None)
+
+        if not result.get('access_token'):
+            logging.info(f"HH token was not refreshed: {result}")
+            return None
+
+        logging.info("HH token refreshed")
+        expires_at = None
+        if result.get('expires_in'):
+            expires_at = datetime.datetime.now() + datetime.timedelta(seconds=int(result.get('expires_in')))
+        return TokenState(
+            access_token=result.get('access_token'),
+            refresh_token=result.get('refresh_token'),
+            expires_at=expires_at,
+            version=state.version
+        )
+
+
+hh_tokens = TokenManager()
@@ -0,0 +1,104 @@
+"""
+Figures of the background job run in progress, kept in `current_job`.
+"""
+import asyncio
+import contextvars
+import typing
+from dataclasses import dataclass, field
+
+import psutil
+
+
+@dataclass
+class StageFigures:
+    seconds: float = 0.0
+    items: int = 0
+    errors: int = 0
+
+
+@dataclass
+class JobStats:
+    items_scanned: int = 0
+    items_changed: int = 0
+    # Client (hh, bitrix) -> requests sent
+    http_calls: typing.Dict[str, int] = field(default_factory=dict)
+    stages: typing.Dict[str, StageFigures] = field(default_factory=dict)
+    # Failures the job handled itself (a page, a discard): the run goes on
+    errors: int = 0
+    peak_memory: typing.Optional[int] = None
+
+
+# Set by a run; the tasks it starts copy the context and add to the same
+# stats. Outside of a run the functions below do nothing
+current_job: contextvars.ContextVar[typing.Optional[JobStats]] = contextvars.ContextVar(
+    'current_job', default=None
+)
+
+
+def count_items(
+        scanned: int = 0,
+        changed: int = 0
+):
+    stats = current_job.get()
+    if stats is None:
+        return
+    stats.items_scanned += scanned
+    stats.items_changed += changed
+
+
+def count_http_call(client: str):
+    stats = current_job.get()
+    if stats is None:
+        return
+    stats.http_calls[client] = stats.http_calls.get(client, 0) + 1
+
+
+def record_stage(
+        name: str,
+        seconds: float,
+        items: int = 0,
+        errors: int = 0
+):
+    stats = current_job.get()
+    if stats is None:
+        return
+    figures = stats.stages.setdefault(name, StageFigures())
+    figures.seconds += seconds
+    figures.items += items
+    figures.errors += errors
+    stats.errors += errors
+
+
+class MemorySampler:
+    """Peak resident memory of the process while the sampler runs.
+
+    The process is shared with the API and the other jobs: the peak is an
+    upper bound of what the job needed, sampled every `interval` seconds.
+    """
+
+    def __init__(
+            self,
+            interval: float = 0.5
+    ):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self.task: typing.Optional[asyncio.Task] = None
+
+    def sample(self):
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self) -> 'MemorySampler':
+        self.sample()
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.sample()
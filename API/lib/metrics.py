@@ -0,0 +1,318 @@
+"""
+Outbound HTTP metrics (latency by phase, status codes, bytes) in the
+Prometheus text format.
+"""
+import bisect
+import re
+import time
+import types
+import typing
+
+import aiohttp
+
+from API.lib.job_stats import count_http_call
+
+__all__ = ("Counter", "Gauge", "Histogram", "Registry", "registry", "trace_config",
+           "path_endpoint", "last_segment_endpoint", "CONTENT_TYPE", )
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = typing.Tuple[typing.Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+
+    type = 'counter'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.values: typing.Dict[Labels, float] = {}
+
+    def inc(
+            self,
+            amount: float = 1,
+            **labels: str
+    ):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> typing.Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+
+    type = 'gauge'
+
+    def set(
+            self,
+            value: float,
+            **labels: str
+    ):
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def dec(
+            self,
+            amount: float = 1,
+            **labels: str
+    ):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+
+    type = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            buckets: typing.Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (count per bucket, +Inf included; sum)
+        self.values: typing.Dict[Labels, typing.List] = {}
+
+    def observe(
+            self,
+            value: float,
+            **labels: str
+    ):
+        key = tuple(sorted(labels.items()))
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        counts[0][bisect.bisect_left(self.buckets, value)] += 1
+        counts[1] += value
+
+    def samples(self) -> typing.Iterator[str]:
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket{_format_labels(labels, (('le', _format_value(bound)),))} "
+                    f"{cumulative}"
+                )
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics: typing.Dict[str, typing.Union[Counter, Gauge, Histogram]] = {}
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._register(Gauge(name, documentation))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            buckets: typing.Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def _register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    'http_client_request_duration_seconds',
+    'Outbound HTTP request duration by phase'
+)
+responses_total = registry.counter(
+    'http_client_responses_total',
+    'Outbound HTTP responses by status code'
+)
+errors_total = registry.counter(
+    'http_client_errors_total',
+    'Outbound HTTP requests that failed without a response'
+)
+sent_bytes = registry.counter(
+    'http_client_request_bytes_total',
+    'Bytes of outbound HTTP request bodies'
+)
+received_bytes = registry.counter(
+    'http_client_response_bytes_total',
+    'Bytes of outbound HTTP response bodies'
+)
+
+_ID_SEGMENT = re.compile(r'.*\d.*')
+_METHOD_SEGMENT = re.compile(r'[a-z_]+')
+# First path segments of the HH API methods (and of the token url)
+_API_ROOTS = frozenset((
+    'areas', 'dictionaries', 'employers', 'negotiations', 'oauth',
+    'professional_roles', 'resumes', 'vacancies',
+))
+
+
+def path_endpoint(url) -> str:
+    """API method of a URL: the path with identifiers replaced by {id}.
+
+    Any other path, e.g. a file url carrying the candidate's name, is
+    'other': a label value must neither hold personal data nor be unbounded.
+    """
+    segments = url.path.strip('/').split('/')
+    if segments[0] not in _API_ROOTS:
+        return 'other'
+    endpoint = []
+    for segment in segments:
+        if _ID_SEGMENT.fullmatch(segment):
+            endpoint.append('{id}')
+        elif _METHOD_SEGMENT.fullmatch(segment):
+            endpoint.append(segment)
+        else:
+            return 'other'
+    return '/' + '/'.join(endpoint)
+
+
+def last_segment_endpoint(url) -> str:
+    # Bitrix webhook URLs carry the token in the path: keep the method only
+    return url.path.rsplit('/', 1)[-1]
+
+
+def trace_config(
+        client: str,
+        endpoint: typing.Callable[[typing.Any], str] = path_endpoint
+) -> aiohttp.TraceConfig:
+    """TraceConfig recording the metrics above under the label client=`client`.
+
+    Phases: queued (waiting for a pooled connection), dns, connect (TLS
+    included), ttfb, body (up to the release of the connection) and total.
+    The endpoint label is computed by `endpoint(url)`, unless the request
+    passes trace_request_ctx={'endpoint': ...}.
+    """
+
+    def make_context(trace_request_ctx=None) -> types.SimpleNamespace:
+        return types.SimpleNamespace(trace_request_ctx=trace_request_ctx)
+
+    config = aiohttp.TraceConfig(trace_config_ctx_factory=make_context)
+
+    def observe(ctx, phase: str, seconds: float):
+        request_duration.observe(seconds, phase=phase, **ctx.labels)
+
+    async def on_request_start(session, ctx, params):
+        explicit = ctx.trace_request_ctx.get('endpoint') if isinstance(ctx.trace_request_ctx, dict) else None
+        ctx.labels = {
+            'client': client,
+            'host': params.url.host or '',
+            'method': params.method,
+            'endpoint': explicit or endpoint(params.url)
+        }
+        ctx.started_at = time.perf_counter()
+        ctx.phase_started_at = {}
+        # Retries included: every request that goes out
+        count_http_call(client)
+        ctx.headers_sent_at = None
+        ctx.dns_seconds = 0.0
+
+    def phase_start(name: str):
+        async def handler(session, ctx, params):
+            ctx.phase_started_at[name] = time.perf_counter()
+        return handler
+
+    def phase_end(name: str):
+        async def handler(session, ctx, params):
+            started_at = ctx.phase_started_at.pop(name, None)
+            if started_at is not None:
+                observe(ctx, name, time.perf_counter() - started_at)
+        return handler
+
+    async def on_connection_create_end(session, ctx, params):
+        started_at = ctx.phase_started_at.pop('connect', None)
+        if started_at is None:
+            return
+        # DNS resolution happens inside the connection creation
+        observe(ctx, 'connect', time.perf_counter() - started_at - ctx.dns_seconds)
+
+    async def on_dns_resolvehost_end(session, ctx, params):
+        started_at = ctx.phase_started_at.pop('dns', None)
+        if started_at is not None:
+            ctx.dns_seconds = time.perf_counter() - started_at
+            observe(ctx, 'dns', ctx.dns_seconds)
+
+    async def on_request_headers_sent(session, ctx, params):
+        ctx.headers_sent_at = time.perf_counter()
+
+    async def on_request_chunk_sent(session, ctx, params):
+        sent_bytes.inc(len(params.chunk), **ctx.labels)
+
+    async def on_request_end(session, ctx, params):
+        response = params.response
+        headers_at = time.perf_counter()
+        if ctx.headers_sent_at is not None:
+            observe(ctx, 'ttfb', headers_at - ctx.headers_sent_at)
+        responses_total.inc(status=str(response.status), **ctx.labels)
+
+        def on_body_end():
+            now = time.perf_counter()
+            observe(ctx, 'body', now - headers_at)
+            observe(ctx, 'total', now - ctx.started_at)
+            received_bytes.inc(response.content.total_bytes, **ctx.labels)
+
+        if response.connection is not None:
+            response.connection.add_callback(on_body_end)
+        else:
+            # No body, the connection was released with the headers
+            on_body_end()
+
+    async def on_request_exception(session, ctx, params):
+        errors_total.inc(error=type(params.exception).__name__, **ctx.labels)
+        observe(ctx, 'total', time.perf_counter() - ctx.started_at)
+
+    config.on_request_start.append(on_request_start)
+    config.on_connection_queued_start.append(phase_start('queued'))
+    config.on_connection_queued_end.append(phase_end('queued'))
+    config.on_connection_create_start.append(phase_start('connect'))
+    config.on_connection_create_end.append(on_connection_create_end)
+    config.on_dns_resolvehost_start.append(phase_start('dns'))
+    config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    config.on_request_headers_sent.append(on_request_headers_sent)
+    config.on_request_chunk_sent.append(on_request_chunk_sent)
+    config.on_request_end.append(on_request_end)
+    config.on_request_exception.append(on_request_exception)
+    return config
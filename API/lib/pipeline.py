@@ -0,0 +1,212 @@
+import asyncio
+import inspect
+import logging
+import reprlib
+import time
+import typing
+from dataclasses import dataclass, field
+
+from API.lib.job_stats import record_stage
+from API.lib.metrics import registry
+
+items_total = registry.counter(
+    'pipeline_items_total',
+    'Items handled by a pipeline stage, by outcome'
+)
+stage_seconds = registry.histogram(
+    'pipeline_stage_seconds',
+    'Time a pipeline stage took for one item'
+)
+queue_depth = registry.gauge(
+    'pipeline_queue_depth',
+    'Items waiting in the input queue of a pipeline stage'
+)
+busy_workers = registry.gauge(
+    'pipeline_busy_workers',
+    'Workers of a pipeline stage running a handler'
+)
+
+# Tells a worker that its stage has no more input
+_END = object()
+
+
+@dataclass
+class Stage:
+    """`handler` is a coroutine function, its result going to the next stage,
+    or an async generator function, every yielded item going to it."""
+    name: str
+    handler: typing.Callable[[typing.Any], typing.Any]
+    workers: int = 1
+    # Seconds for one item (one yielded item for a generator), None for no limit
+    timeout: typing.Optional[float] = None
+
+
+@dataclass
+class StageStats:
+    ok: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    # Sum of the handler durations over all workers
+    busy_seconds: float = 0.0
+
+
+@dataclass
+class Pipeline:
+    """Stages joined by bounded queues: a slow stage blocks the ones before it.
+
+    A handler that fails or times out loses its item only.
+    """
+    name: str
+    stages: typing.List[Stage]
+    # Capacity of the input queue of every stage
+    queue_size: int = 100
+    stats: typing.Dict[str, StageStats] = field(default_factory=dict)
+
+    async def run(
+            self,
+            source: typing.Union[typing.Iterable, typing.AsyncIterable]
+    ) -> typing.Dict[str, StageStats]:
+        """Push the items of `source` through the stages, return the stats."""
+        self.stats = {stage.name: StageStats() for stage in self.stages}
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+
+        async def feed():
+            if hasattr(source, '__aiter__'):
+                async for item in source:
+                    await self._put(0, queues, item)
+            else:
+                for item in source:
+                    await self._put(0, queues, item)
+            await self._end(0, queues)
+
+        async def run_stage(index: int):
+            await asyncio.gather(*(
+                self._work(index, queues) for _ in range(self.stages[index].workers)
+            ))
+            if index + 1 < len(self.stages):
+                await self._end(index + 1, queues)
+
+        tasks = [asyncio.create_task(feed())] + [
+            asyncio.create_task(run_stage(index)) for index in range(len(self.stages))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for stage in self.stages:
+                queue_depth.set(0, pipeline=self.name, stage=stage.name)
+        for name, stats in self.stats.items():
+            record_stage(name, stats.busy_seconds, items=stats.ok, errors=stats.errors + stats.timeouts)
+        return self.stats
+
+    async def _put(
+            self,
+            index: int,
+            queues: typing.List[asyncio.Queue],
+            item: typing.Any
+    ):
+        # Blocks while the stage is behind: the backpressure
+        await queues[index].put(item)
+        queue_depth.set(queues[index].qsize(), pipeline=self.name, stage=self.stages[index].name)
+
+    async def _end(
+            self,
+            index: int,
+            queues: typing.List[asyncio.Queue]
+    ):
+        for _ in range(self.stages[index].workers):
+            await queues[index].put(_END)
+
+    async def _work(
+            self,
+            index: int,
+            queues: typing.List[asyncio.Queue]
+    ):
+        stage = self.stages[index]
+        labels = {'pipeline': self.name, 'stage': stage.name}
+        while True:
+            item = await queues[index].get()
+            if item is _END:
+                return
+            queue_depth.set(queues[index].qsize(), **labels)
+            busy_workers.inc(**labels)
+            try:
+                if inspect.isasyncgenfunction(stage.handler):
+                    await self._handle_generator(index, queues, stage, item)
+                else:
+                    await self._handle(index, queues, stage, item)
+            finally:
+                busy_workers.dec(**labels)
+
+    async def _handle(
+            self,
+            index: int,
+            queues: typing.List[asyncio.Queue],
+            stage: Stage,
+            item: typing.Any
+    ):
+        started_at = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(stage.handler(item), timeout=stage.timeout)
+        except asyncio.TimeoutError:
+            self._record(stage, 'timeout', time.perf_counter() - started_at)
+            logging.info(f"Pipeline {self.name}: stage {stage.name} timed out on {reprlib.repr(item)}")
+            return
+        except Exception as e:
+            self._record(stage, 'error', time.perf_counter() - started_at)
+            logging.exception(e)
+            return
+        self._record(stage, 'ok', time.perf_counter() - started_at)
+        if result is not None and index + 1 < len(self.stages):
+            await self._put(index + 1, queues, result)
+
+    async def _handle_generator(
+            self,
+            index: int,
+            queues: typing.List[asyncio.Queue],
+            stage: Stage,
+            item: typing.Any
+    ):
+        results = stage.handler(item)
+        # Time spent in the generator, not waiting for the next stage
+        seconds = 0.0
+        try:
+            while True:
+                started_at = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(results.__anext__(), timeout=stage.timeout)
+                except StopAsyncIteration:
+                    self._record(stage, 'ok', seconds + time.perf_counter() - started_at)
+                    return
+                except asyncio.TimeoutError:
+                    self._record(stage, 'timeout', seconds + time.perf_counter() - started_at)
+                    logging.info(f"Pipeline {self.name}: stage {stage.name} timed out on {reprlib.repr(item)}")
+                    return
+                except Exception as e:
+                    self._record(stage, 'error', seconds + time.perf_counter() - started_at)
+                    logging.exception(e)
+                    return
+                seconds += time.perf_counter() - started_at
+                if result is not None and index + 1 < len(self.stages):
+                    await self._put(index + 1, queues, result)
+        finally:
+            await results.aclose()
+
+    def _record(
+            self,
+            stage: Stage,
+            outcome: str,
+            seconds: float
+    ):
+        stats = self.stats[stage.name]
+        stats.busy_seconds += seconds
+        if outcome == 'ok':
+            stats.ok += 1
+        elif outcome == 'timeout':
+            stats.timeouts += 1
+        else:
+            stats.errors += 1
+        items_total.inc(pipeline=self.name, stage=stage.name, outcome=outcome)
+        stage_seconds.observe(seconds, pipeline=self.name, stage=stage.name)
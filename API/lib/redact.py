@@ -0,0 +1,41 @@
+import typing
+
+__all__ = ("Redacted", "redact", )
+
+
+def redact(
+        value: typing.Any,
+        max_length: int = 200
+) -> typing.Any:
+    """`value` with long strings and byte strings replaced by their size."""
+    if isinstance(value, dict):
+        return {k: redact(v, max_length) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(v, max_length) for v in value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<{len(value)} bytes>'
+    if isinstance(value, str) and len(value) > max_length:
+        return f'{value[:32]}...<{len(value)} chars>'
+    if hasattr(value, '__aiter__'):
+        return '<stream>'
+    return value
+
+
+class Redacted:
+    """Log argument rendered with `redact` only if the record is emitted.
+
+        logging.debug("kwargs %s", Redacted(kwargs))
+    """
+
+    __slots__ = ('value', 'max_length', )
+
+    def __init__(
+            self,
+            value: typing.Any,
+            max_length: int = 200
+    ):
+        self.value = value
+        self.max_length = max_length
+
+    def __str__(self) -> str:
+        return str(redact(self.value, self.max_length))
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import random
+import time
+import typing
+from dataclasses import dataclass
+
+import aiohttp
+
+__all__ = ("IDEMPOTENT_METHODS", "RETRY_STATUSES", "TRANSIENT_ERRORS",
+           "CircuitOpenError", "UpstreamUnavailable", "CircuitBreaker", "breakers",
+           "RetryPolicy", "RetryBudget", )
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+
+# Failures of the transport: the host is unreachable, slow or cut the answer
+TRANSIENT_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+
+class CircuitOpenError(Exception):
+
+    def __init__(
+            self,
+            name: str,
+            retry_in: float
+    ):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"Circuit '{name}' is open, next attempt in {retry_in:.1f}s")
+
+
+class UpstreamUnavailable(Exception):
+    """The host answered 429 or a retryable 5xx until the retries ran out."""
+
+    def __init__(
+            self,
+            name: str,
+            status: int,
+            retry_in: typing.Optional[float] = None
+    ):
+        self.name = name
+        self.status = status
+        self.retry_in = retry_in
+        super().__init__(f"{name} answered {status}, retries exhausted")
+
+
+# name -> breaker, for the admin endpoint
+breakers: typing.Dict[str, 'CircuitBreaker'] = {}
+
+
+class CircuitBreaker:
+    """Fails requests to a host fast after `failure_threshold` failures in a row.
+
+    While open every request raises CircuitOpenError without touching the
+    network. After `reset_timeout` seconds one probe request is let through
+    (half-open): its success closes the circuit, its failure opens it again.
+    """
+
+    closed = 'closed'
+    open = 'open'
+    half_open = 'half_open'
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: int = 5,
+            reset_timeout: float = 30.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.closed
+        self.failures = 0
+        self.opened_at: typing.Optional[float] = None
+        self.probe_started_at: typing.Optional[float] = None
+
+        # Counters since the start of the process
+        self.requests = 0
+        self.total_failures = 0
+        self.retries = 0
+        self.rejected = 0
+        self.opened = 0
+        breakers[name] = self
+
+    @classmethod
+    def from_settings(
+            cls,
+            name: str,
+            settings
+    ) -> 'CircuitBreaker':
+        return cls(
+            name=name,
+            failure_threshold=settings.breaker_failures,
+            reset_timeout=settings.breaker_reset_timeout
+        )
+
+    def before_request(self):
+        now = time.monotonic()
+        if self.state == self.open:
+            if now - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.reset_timeout - (now - self.opened_at))
+            self.state = self.half_open
+            self.probe_started_at = None
+            logging.info(f"Circuit '{self.name}' is half-open")
+        if self.state == self.half_open:
+            # A probe that never reported back (cancelled) is replaced after reset_timeout
+            if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.reset_timeout - (now - self.probe_started_at))
+            self.probe_started_at = now
+        self.requests += 1
+
+    def record_success(self):
+        if self.state != self.closed:
+            logging.info(f"Circuit '{self.name}' is closed")
+        self.state = self.closed
+        self.failures = 0
+        self.probe_started_at = None
+
+    def release(self):
+        """The request got no verdict on the host (a 429): the probe slot is free again."""
+        self.probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self.total_failures += 1
+        if self.state == self.half_open or (
+                self.state == self.closed and self.failures >= self.failure_threshold
+        ):
+            self.state = self.open
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+            self.opened += 1
+            logging.info(f"Circuit '{self.name}' is open after {self.failures} failures")
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'open_for': round(time.monotonic() - self.opened_at, 1) if self.state == self.open else None,
+            'requests': self.requests,
+            'failures': self.total_failures,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'opened': self.opened
+        }
+
+
+@dataclass
+class RetryPolicy:
+    """Retries of one host: how often, how long apart, and for how long in total."""
+
+    # Tries of a request, the first one included
+    attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 10.0
+    # Seconds from the first try after which no new try is started
+    deadline: float = 30.0
+    methods: typing.FrozenSet[str] = IDEMPOTENT_METHODS
+    statuses: typing.FrozenSet[int] = RETRY_STATUSES
+
+    @classmethod
+    def from_settings(
+            cls,
+            settings
+    ) -> 'RetryPolicy':
+        return cls(
+            attempts=settings.retry_attempts,
+            base_delay=settings.retry_base_delay,
+            max_delay=settings.retry_max_delay,
+            deadline=settings.request_deadline
+        )
+
+    def delay(self, attempt: int) -> float:
+        # "Full jitter": concurrent clients do not come back at the same moment
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def start(
+            self,
+            method: str,
+            breaker: typing.Optional[CircuitBreaker] = None
+    ) -> 'RetryBudget':
+        return RetryBudget(self, method, breaker)
+
+
+class RetryBudget:
+    """Retry state of a single request."""
+
+    def __init__(
+            self,
+            policy: RetryPolicy,
+            method: str,
+            breaker: typing.Optional[CircuitBreaker] = None
+    ):
+        self.policy = policy
+        self.method = method.upper()
+        self.breaker = breaker
+        self.attempt = 0
+        self.deadline = time.monotonic() + policy.deadline
+
+    @property
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def timeout(
+            self,
+            base: aiohttp.ClientTimeout
+    ) -> aiohttp.ClientTimeout:
+        """`base` with the total cut down to what is left of the deadline."""
+        total = max(self.remaining, 0.001)
+        if base.total is not None:
+            total = min(total, base.total)
+        return aiohttp.ClientTimeout(
+            total=total,
+            connect=base.connect,
+            sock_read=base.sock_read,
+            sock_connect=base.sock_connect
+        )
+
+    async def backoff(
+            self,
+            reason: typing.Union[int, BaseException]
+    ) -> bool:
+        """Wait before the next try; False if the request must not be retried.
+
+        A request that failed to connect was never sent, so it is retried
+        whatever the method; other failures only for idempotent methods.
+        """
+        if self.breaker is not None:
+            self.breaker.record_failure()
+        never_sent = isinstance(reason, aiohttp.ClientConnectorError)
+        if not never_sent and self.method not in self.policy.methods:
+            return False
+        if self.attempt + 1 >= self.policy.attempts:
+            return False
+        delay = self.policy.delay(self.attempt)
+        if delay >= self.remaining:
+            return False
+
+        self.attempt += 1
+        if self.breaker is not None:
+            self.breaker.retries += 1
+        logging.info(f"Retry {self.attempt} of {self.method} in {delay:.2f}s after {reason!r}")
+        await asyncio.sleep(delay)
+        return True
@@ -111,6 +111,7 @@ class Resume(BaseModel):
     url: typing.Optional[str] = None
     education: typing.List[Education] = None
     experience: typing.List[Experience] = None
+    updated_at: typing.Optional[str] = None
 
 
 @dataclass
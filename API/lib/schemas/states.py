@@ -10,6 +10,20 @@ class States(BaseModel):
     name: typing.Optional[str] = None
 
 
+@dataclass
+class ActionResult(BaseModel):
+    """Outcome of a state change of one negotiation."""
+    id: typing.Optional[str] = None
+    ok: bool = False
+    status: typing.Optional[int] = None
+    error: typing.Optional[str] = None
+
+    @property
+    def refused(self) -> bool:
+        """HH refused the request itself (4xx but 429): trying again will not help."""
+        return self.status is not None and 400 <= self.status < 500 and self.status != 429
+
+
 @dataclass
 class CollectionStates(BaseModel):
     data: typing.List[States] = None
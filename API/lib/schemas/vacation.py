@@ -102,6 +102,7 @@ class Vacation(BaseModel):
 class VacationItems(BaseModel):
     data: typing.List[Vacation] = None
     found: typing.Optional[int] = 100
+    pages: typing.Optional[int] = None
 
     def append_item(self, item: Vacation):
         if self.data is None or not self.data:
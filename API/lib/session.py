@@ -0,0 +1,91 @@
+import logging
+import typing
+
+import aiohttp
+
+__all__ = ("SessionPool", )
+
+
+class SessionPool:
+    """Process-wide aiohttp session with a pooled keep-alive connector.
+
+    The session is created lazily on the first request (so it is bound to
+    the running event loop) and has to be closed on application shutdown.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            limit: int = 100,
+            limit_per_host: int = 20,
+            keepalive_timeout: float = 30.0,
+            dns_cache_ttl: int = 300,
+            total_timeout: float = 60.0,
+            connect_timeout: float = 10.0,
+            read_timeout: float = 30.0,
+            force_close: bool = False,
+            trace_configs: typing.Optional[typing.List[aiohttp.TraceConfig]] = None
+    ):
+        self.name = name
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.force_close = force_close
+        self.trace_configs = trace_configs
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout,
+            connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        self._session: typing.Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_settings(
+            cls,
+            name: str,
+            settings,
+            trace_configs: typing.Optional[typing.List[aiohttp.TraceConfig]] = None
+    ) -> 'SessionPool':
+        return cls(
+            name=name,
+            limit=settings.connections_limit,
+            limit_per_host=settings.connections_per_host,
+            keepalive_timeout=settings.keepalive_timeout,
+            dns_cache_ttl=settings.dns_cache_ttl,
+            total_timeout=settings.total_timeout,
+            connect_timeout=settings.connect_timeout,
+            read_timeout=settings.read_timeout,
+            trace_configs=trace_configs
+        )
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+            # aiohttp refuses keepalive_timeout together with force_close
+            keepalive_timeout=None if self.force_close else self.keepalive_timeout,
+            force_close=self.force_close
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            trace_configs=self.trace_configs
+        )
+
+    async def start(self) -> aiohttp.ClientSession:
+        return await self.get()
+
+    async def get(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            logging.info(f"Open HTTP session pool '{self.name}'")
+            self._session = self._create_session()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            logging.info(f"Close HTTP session pool '{self.name}'")
+            await self._session.close()
+        self._session = None
@@ -1,18 +1,32 @@
 import logging
 from http.client import HTTPException
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from loguru import logger
 from starlette.responses import JSONResponse
 
 from API.config import settings
+from API.domain.authentication import validate_security
 from API import application
 from API.infrastructure.database.models import Base
+from API.infrastructure.database.commands import upgrade_schema
 from API.infrastructure.database.session import engine, SESSION_MAKER
 from API.presentation import rest, middleware
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from API.infrastructure.utils.tasks import add_vacation_days, check_work_period
-from API.infrastructure.utils.hh_tasks import auto_analysis
+from API.infrastructure.utils.bitrix_outbox import BitrixOutboxWorkers
+from API.infrastructure.utils.hh_tasks import auto_analysis, evict_resume_files, refresh_reference_data
+from API.infrastructure.utils.hh_reference import DatabaseReferenceStorage
+from API.infrastructure.utils.hh_resumes import DatabaseResumeStorage
+from API.infrastructure.utils.hh_tokens import DatabaseTokenStorage
+from API.infrastructure.utils.scheduling import SchedulerLeader, recorded, single_run
+from API.lib.bitrix.base import bitrix_session_pool
+from API.lib.hh.base import hh_session_pool
+from API.lib.hh.token import hh_tokens
+from API.lib.hh.cache import hh_reference
+from API.lib.hh.resume_cache import hh_resume_cache
+from API.lib.resilience import CircuitOpenError, UpstreamUnavailable
+from API.lib import metrics
 
 # Adjust the logging
 # -------------------------------
@@ -38,51 +52,103 @@ logger.add(
 
 # Adjust the application
 # -------------------------------
+bitrix_outbox = BitrixOutboxWorkers(SESSION_MAKER)
+
+# A run still going when the next one is due: the next one is skipped, and
+# runs missed in a row (a blocked loop, a new leader) are made only once
+job_defaults = {
+    'max_instances': 1,
+    'coalesce': True,
+    'misfire_grace_time': settings.scheduler.misfire_grace_time
+}
+
+# Jobs of the whole cluster: run by the leader process only
+leader_scheduler = AsyncIOScheduler(
+         timezone='Asia/Aqtobe',
+         job_defaults=job_defaults
+    )
+scheduler_leader = SchedulerLeader(engine, leader_scheduler)
+
 app: FastAPI = application.create(
     debug=settings.debug_status,
     rest_routers=(
         rest.vacation.router,
-        rest.recruiting.router
+        rest.recruiting.router,
+        rest.admin.router
     ),
     middlewares=(
         middleware.db_session_middleware,
     ),
+    metrics=metrics.registry.render,
+    metrics_content_type=metrics.CONTENT_TYPE,
+    # The same basic auth as the /v1/admin routes
+    metrics_dependencies=[Depends(validate_security)],
     startup_tasks=[],
-    shutdown_tasks=[],
+    shutdown_tasks=[
+        # Hands the scheduled jobs over to another process
+        scheduler_leader.stop,
+        # Before the pools: a worker finishes the batch it is sending
+        bitrix_outbox.stop,
+        hh_session_pool.close,
+        bitrix_session_pool.close,
+    ],
     docs_url="/docs", redoc_url=None
 )
-scheduler = AsyncIOScheduler(
-         timezone='Asia/Aqtobe'
-    )
-scheduler.add_job(
-    add_vacation_days,
+hh_tokens.storage = DatabaseTokenStorage(SESSION_MAKER)
+hh_reference.storage = DatabaseReferenceStorage(SESSION_MAKER)
+hh_resume_cache.storage = DatabaseResumeStorage(SESSION_MAKER)
+
+leader_scheduler.add_job(
+    single_run(engine, recorded(SESSION_MAKER, add_vacation_days)),
     'cron',
     hour=10,
     minute=0,
     args=(SESSION_MAKER,)
 )
 
-scheduler.add_job(
-    check_work_period,
+leader_scheduler.add_job(
+    single_run(engine, recorded(SESSION_MAKER, check_work_period)),
     'cron',
     hour=10,
     minute=1,
     args=(SESSION_MAKER,)
 )
 # Для теста
-scheduler.add_job(
-    auto_analysis,
+leader_scheduler.add_job(
+    single_run(engine, recorded(SESSION_MAKER, auto_analysis)),
     'interval',
     minutes=59,
     args=(SESSION_MAKER,)
 )
 
+# Jobs of every process: its own caches
+scheduler = AsyncIOScheduler(
+         timezone='Asia/Aqtobe',
+         job_defaults=job_defaults
+    )
+scheduler.add_job(
+    refresh_reference_data,
+    'interval',
+    seconds=settings.hh.reference_refresh_interval
+)
+scheduler.add_job(
+    evict_resume_files,
+    'interval',
+    hours=1
+)
+
 
 @app.on_event('startup')
 async def startup_event():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await upgrade_schema(conn)
+    await hh_session_pool.start()
+    await bitrix_session_pool.start()
+    await hh_reference.warm_up()
+    await bitrix_outbox.start()
     scheduler.start()
+    await scheduler_leader.start()
 
 
 @app.exception_handler(HTTPException)
@@ -91,3 +157,22 @@ async def http_exception_handler(request, exc):
         status_code=exc.status_code,
         content={"error": "Internal Server Error"}
     )
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"error": f"{exc.name} is unavailable"},
+        headers={"Retry-After": str(int(exc.retry_in) + 1)}
+    )
+
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request, exc):
+    headers = {"Retry-After": str(int(exc.retry_in) + 1)} if exc.retry_in else None
+    return JSONResponse(
+        status_code=503,
+        content={"error": f"{exc.name} is unavailable"},
+        headers=headers
+    )
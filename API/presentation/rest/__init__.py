@@ -1,2 +1,3 @@
 from . import vacation
 from . import recruiting
+from . import admin
@@ -0,0 +1,145 @@
+import datetime
+import typing
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security import HTTPBasicCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from API.domain.authentication import validate_security
+from API.infrastructure.database.jobs import JobRuns
+from API.infrastructure.database.recruiting import BitrixOutbox
+from API.infrastructure.database.session import db_session
+from API.lib.hh.HeadHunter import HeadHunter
+from API.lib.resilience import breakers
+
+router = APIRouter()
+
+
+@router.post('/v1/admin/reference/refresh',
+             tags=['Admin'],
+             summary="Принудительное обновление справочников HeadHunter")
+async def refresh_reference(
+        credentials: typing.Annotated[HTTPBasicCredentials, Depends(validate_security)],
+        name: typing.Optional[str] = None
+):
+    hh = HeadHunter()
+    if name is not None and name not in hh.reference.sources:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown reference data '{name}'"
+        )
+
+    names = [name] if name else list(hh.reference.sources)
+    for n in names:
+        await hh.reference.refresh(hh, n)
+    return {
+        'status_code': 200,
+        'data': {
+            n: {
+                'fetched_at': datetime.datetime.fromtimestamp(
+                    hh.reference.entries[n].fetched_at
+                ).isoformat() if hh.reference.entries[n].fetched_at else None,
+                'stale': hh.reference.is_stale(n)
+            }
+            for n in names
+        }
+    }
+
+
+@router.get('/v1/admin/resilience',
+            tags=['Admin'],
+            summary="Состояние circuit breaker'ов и счётчики повторов HeadHunter и Bitrix")
+async def get_resilience(
+        credentials: typing.Annotated[HTTPBasicCredentials, Depends(validate_security)]
+):
+    return {
+        'status_code': 200,
+        'data': [breaker.stats() for breaker in breakers.values()]
+    }
+
+
+@router.get('/v1/admin/outbox',
+            tags=['Admin'],
+            summary="Очередь отправки кандидатов в Bitrix: записи по статусам и недоставленные")
+async def get_outbox(
+        credentials: typing.Annotated[HTTPBasicCredentials, Depends(validate_security)],
+        limit: int = 100
+):
+    session: AsyncSession = db_session.get()
+    dead = await BitrixOutbox.get_dead(session, limit=limit)
+    return {
+        'status_code': 200,
+        'data': {
+            'counts': await BitrixOutbox.count_by_status(session),
+            'dead': [
+                {
+                    'id': entry.id,
+                    'negotiation_id': entry.negotiation_id,
+                    'vacancies_id': entry.vacancies_id,
+                    'attempts': entry.attempts,
+                    'last_error': entry.last_error,
+                    'created_at': entry.created_at.isoformat() if entry.created_at else None
+                }
+                for entry in dead
+            ]
+        }
+    }
+
+
+@router.post('/v1/admin/outbox/{entry_id}/retry',
+             tags=['Admin'],
+             summary="Повторная отправка недоставленного кандидата в Bitrix")
+async def retry_outbox_entry(
+        credentials: typing.Annotated[HTTPBasicCredentials, Depends(validate_security)],
+        entry_id: int
+):
+    session: AsyncSession = db_session.get()
+    if not await BitrixOutbox.requeue(session, entry_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No dead outbox entry {entry_id}"
+        )
+    await session.commit()
+    return {
+        'status_code': 200,
+        'data': {'id': entry_id}
+    }
+
+
+@router.get('/v1/admin/jobs',
+            tags=['Admin'],
+            summary="Последние запуски фоновых задач и перцентили их показателей")
+async def get_job_runs(
+        credentials: typing.Annotated[HTTPBasicCredentials, Depends(validate_security)],
+        job: typing.Optional[str] = None,
+        limit: int = 50,
+        days: int = 30
+):
+    session: AsyncSession = db_session.get()
+    runs = await JobRuns.get_recent(session, job=job, limit=limit)
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+    return {
+        'status_code': 200,
+        'data': {
+            'percentiles': await JobRuns.get_percentiles(session, since=since, job=job),
+            'runs': [
+                {
+                    'id': run.id,
+                    'job': run.job,
+                    'status': run.status,
+                    'started_at': run.started_at.isoformat(),
+                    'finished_at': run.finished_at.isoformat(),
+                    'duration': run.duration,
+                    'stages': run.stages,
+                    'items_scanned': run.items_scanned,
+                    'items_changed': run.items_changed,
+                    'http_calls': run.http_calls,
+                    'errors': run.errors,
+                    'error': run.error,
+                    'peak_memory': run.peak_memory
+                }
+                for run in runs
+            ]
+        }
+    }
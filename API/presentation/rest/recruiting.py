@@ -13,11 +13,12 @@ from starlette.responses import RedirectResponse
 from API.domain.authentication import security, validate_security
 from API.infrastructure.database.session import db_session
 from API.lib.hh.HeadHunter import HeadHunter
+from API.lib.hh.texts import discard_message
 from API.lib.schemas.vacation import PublicationVacation, VacationItems, Salary
 from API.lib.schemas.directories import Directories, ItemDirectories
 from API.lib.schemas.resume import ItemAreas
-from API.infrastructure.models.recruiting import ModelVacancies, ModelVac2, ModelDiscard
-from API.infrastructure.database.recruiting import Token, Vacancies
+from API.infrastructure.models.recruiting import ModelVacancies, ModelVac2, ModelDiscard, ModelDiscardBulk
+from API.infrastructure.database.recruiting import Vacancies
 from API.lib.bitrix import dates
 
 router = APIRouter()
@@ -29,18 +30,8 @@ router = APIRouter()
 async def get_managers(
         credentials: typing.Annotated[HTTPBasicCredentials, Depends(validate_security)]
 ):
-
-    session: AsyncSession = db_session.get()
-    token = await Token.get_token(session)
-    hh = HeadHunter(
-        basic_token=token.access_token,
-        refresh_token=token.refresh_token
-    )
-    managers = await hh.get_managers()
-    token.access_token = hh.basic_token
-    token.refresh_token = hh.ref_token
-    session.add(token)
-    await session.commit()
+    hh = HeadHunter()
+    managers = await hh.get_reference('managers')
     return managers
 
 
@@ -55,12 +46,7 @@ async def publication_vacancy(
     for k, v in vac:
         logging.info(f"{k}: {v}")
     session: AsyncSession = db_session.get()
-    token = await Token.get_token(session)
-    #token = "USERHOD1HP6BU2HRPEJEOA018HGO3PQKTBKIO79MS45MPUDM657BB2BI5JBBQ9VN"
-    hh = HeadHunter(
-        basic_token=token.access_token,
-        refresh_token=token.refresh_token
-    )
+    hh = HeadHunter()
     items_work_format: ItemDirectories = await hh.get_dictionaries('work_format')
     items_work_schedule: ItemDirectories = await hh.get_dictionaries('work_schedule_by_days')
     items_working_hours: ItemDirectories = await hh.get_dictionaries('working_hours')
@@ -68,14 +54,14 @@ async def publication_vacancy(
     items_types: ItemDirectories = await hh.get_dictionaries('vacancy_type')
     items_employment_form: ItemDirectories = await hh.get_dictionaries('employment_form')
     items_experience: ItemDirectories = await hh.get_dictionaries('experience')
-    items_role = await hh.get_roles()
-    items_template = await hh.get_brand_templates()
+    items_role = await hh.get_reference('roles')
+    items_template = await hh.get_reference('templates')
     if not vac.type_work:
         vac.type_work = '0'
 
-    address = await hh.get_address()
-    managers = await hh.get_managers()
-    item_areas: ItemAreas = await hh.get_areas()
+    address = await hh.get_reference('address')
+    managers = await hh.get_reference('managers')
+    item_areas: ItemAreas = await hh.get_reference('areas')
     logging.info(vac.toDo.split('*'))
     to_do = [f"<li>{i}</li>\n" if i != "" else "" for i in vac.toDo.split('*')]
     except_candidates = [f"<li>{i}</li>\n" if i != "" else "" for i in vac.exceptCandidates.split('*')]
@@ -127,9 +113,6 @@ async def publication_vacancy(
     logging.info(v.to_json())
     res = await hh.publication_vacation(v.to_json())
     logging.info(f"RES -> {res}")
-    token.access_token = hh.basic_token
-    token.refresh_token = hh.ref_token
-    session.add(token)
 
     vacancies = Vacancies(
         id=res.get('id'),
@@ -159,11 +142,7 @@ async def publication_draft(
     for k, v in vac:
         logging.info(f"{k}: {v}")
     session: AsyncSession = db_session.get()
-    token = await Token.get_token(session)
-    hh = HeadHunter(
-        basic_token=token.access_token,
-        refresh_token=token.refresh_token
-    )
+    hh = HeadHunter()
     items_work_format: ItemDirectories = await hh.get_dictionaries('work_format')
     items_work_schedule: ItemDirectories = await hh.get_dictionaries('work_schedule_by_days')
     items_working_hours: ItemDirectories = await hh.get_dictionaries('working_hours')
@@ -171,14 +150,14 @@ async def publication_draft(
     items_types: ItemDirectories = await hh.get_dictionaries('vacancy_type')
     items_employment_form: ItemDirectories = await hh.get_dictionaries('employment_form')
     items_experience: ItemDirectories = await hh.get_dictionaries('experience')
-    items_role = await hh.get_roles()
-    items_template = await hh.get_brand_templates()
+    items_role = await hh.get_reference('roles')
+    items_template = await hh.get_reference('templates')
     if not vac.type_work:
         vac.type_work = '0'
 
-    address = await hh.get_address()
-    managers = await hh.get_managers()
-    item_areas: ItemAreas = await hh.get_areas()
+    address = await hh.get_reference('address')
+    managers = await hh.get_reference('managers')
+    item_areas: ItemAreas = await hh.get_reference('areas')
     logging.info(vac.toDo.split('*'))
     to_do = [f"<li>{i}</li>\n" if i != "" else "" for i in vac.toDo.split('*')]
     except_candidates = [f"<li>{i}</li>\n" if i != "" else "" for i in vac.exceptCandidates.split('*')]
@@ -230,9 +209,6 @@ async def publication_draft(
     logging.info(v.to_json())
     res = await hh.publication_draft(v.to_json())
     logging.info(f"RES -> {res}")
-    token.access_token = hh.basic_token
-    token.refresh_token = hh.ref_token
-    session.add(token)
     gender = {
         "Женский": "female",
         "Мужской": "male"
@@ -263,19 +239,12 @@ async def publication_vacancy2(
         draft: ModelVac2
 ):
     session: AsyncSession = db_session.get()
-    token = await Token.get_token(session)
     vacancies = await Vacancies.get_vacancies_by_id(
         draft_id=draft.draft_id,
         session=session
     )
-    hh = HeadHunter(
-        basic_token=token.access_token,
-        refresh_token=token.refresh_token
-    )
+    hh = HeadHunter()
     result = await hh.publication_vacancies_by_draft(draft_id=draft.draft_id)
-    token.access_token = hh.basic_token
-    token.refresh_token = hh.ref_token
-    session.add(token)
 
     vacancies.vacancies_id = str(result.get('vacancy_ids')[0])
     vacancies.is_active = True
@@ -298,11 +267,7 @@ async def archive_vacancy(
         draft: ModelVac2
 ):
     session: AsyncSession = db_session.get()
-    token = await Token.get_token(session)
-    hh = HeadHunter(
-        basic_token=token.access_token,
-        refresh_token=token.refresh_token
-    )
+    hh = HeadHunter()
     vacancies = await Vacancies.get_by_id(
         vacancy_id=draft.vacancies_id,
         session=session
@@ -327,11 +292,7 @@ async def publication_archive_vacancy(
 ):
     session: AsyncSession = db_session.get()
     logging.info(draft)
-    token = await Token.get_token(session)
-    hh = HeadHunter(
-        basic_token=token.access_token,
-        refresh_token=token.refresh_token
-    )
+    hh = HeadHunter()
     result = await hh.get_draft_vacancies(draft.draft_id)
     result['previous_id'] = draft.previous_id
     result['area'] = {'id': result.get("areas")[0].get('id')}
@@ -342,9 +303,6 @@ async def publication_archive_vacancy(
         draft_id=draft.draft_id,
         session=session
     )
-    token.access_token = hh.basic_token
-    token.refresh_token = hh.ref_token
-    session.add(token)
 
     vacancies.vacancies_id = str(result2.get('id'))
     vacancies.is_active = True
@@ -364,12 +322,7 @@ async def discard_by_employer_process(
         credentials: typing.Annotated[HTTPBasicCredentials, Depends(validate_security)],
         discard: ModelDiscard
 ):
-    session: AsyncSession = db_session.get()
-    token = await Token.get_token(session)
-    hh = HeadHunter(
-        basic_token=token.access_token,
-        refresh_token=token.refresh_token
-    )
+    hh = HeadHunter()
 
     vacations = VacationItems()
     vacations_all = VacationItems()
@@ -387,21 +340,10 @@ async def discard_by_employer_process(
     # for d in vacations.data:
     #     if d.id == discard.resume_id:
     #         r = d.resume
-    text = '''{name} здравствуйте!
-
-Большое спасибо за интерес к вакансии! К сожалению, сейчас мы не готовы пригласить вас на следующий этап.
-Ценим ваше внимание и будем рады получать ваши отклики на другие позиции.
-
-Дюсембаева Акмарал Бакытовна
-    '''
-    result = await hh.negotiation_message(
-        nid=discard.resume_id,
-        message=text.format(name=discard.name)
-    )
-    #print(result)
     result = await hh.actions_negotiation(
         states_id="discard_by_employer",
-        nid=discard.resume_id
+        nid=discard.resume_id,
+        message=discard_message(discard.name)
     )
     return {
         'status_code': 201,
@@ -410,6 +352,25 @@ async def discard_by_employer_process(
     #print(result)
 
 
+@router.post("/v1/recruiting/discard/bulk")
+async def discard_bulk(
+        credentials: typing.Annotated[HTTPBasicCredentials, Depends(validate_security)],
+        discard: ModelDiscardBulk
+):
+    hh = HeadHunter()
+    results = await hh.discard_negotiations(
+        (item.resume_id, item.name) for item in discard.items
+    )
+    discarded = sum(1 for r in results if r.ok)
+    return {
+        'status_code': 200,
+        'message': f'Отклонено кандидатов: {discarded} из {len(results)}',
+        'discarded': discarded,
+        'failed': len(results) - discarded,
+        'data': [r.dict() for r in results]
+    }
+
+
 @router.post('/v1/qa/vacation/publication_vacancy', deprecated=True)
 async def take_vacation(
         credentials: typing.Annotated[HTTPBasicCredentials, Depends(validate_security)],
@@ -0,0 +1,221 @@
+"""
+End-to-end throughput of auto_analysis against the fake HH and Bitrix.
+
+    python -m benchmarks.auto_analysis --vacancies 5 --responses 200 --latency 0.01
+
+The fake server runs in a child process, so the peak memory reported is
+the one of the code under test. auto_analysis works on the database of
+the DB_* settings: the benchmark adds its own active vacancies (ids
+starting with 'bench-') and removes them afterwards, but it also picks up
+every other active vacancy, so use a scratch database.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import urllib.request
+
+from benchmarks.fake_server import RESUME_PREFIX, FakeSettings, serve
+
+VACANCY_PREFIX = 'bench-'
+
+
+def start_server(settings: FakeSettings):
+    context = multiprocessing.get_context('spawn')
+    urls = context.Queue()
+    stop = context.Event()
+    process = context.Process(target=serve, args=(settings, '127.0.0.1', 0, urls, stop), daemon=True)
+    process.start()
+    return process, stop, urls.get(timeout=30)
+
+
+def server_calls(base_url: str) -> dict:
+    with urllib.request.urlopen(f"{base_url}/__stats") as response:
+        return json.loads(response.read())
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+async def run(args, base_url: str):
+    # The clients read their urls from the settings when they are imported
+    os.environ['HH_API_URL'] = f"{base_url}/{{method}}"
+    os.environ['HH_TOKEN_URL'] = f"{base_url}/oauth/token"
+    os.environ['BITRIX_API_URL'] = f"{base_url}/rest"
+    if args.rate_limit is not None:
+        os.environ['HH_RATE_LIMIT'] = str(args.rate_limit)
+        os.environ['HH_RATE_BURST'] = str(max(int(args.rate_limit), 1))
+
+    from sqlalchemy import delete, func, select
+
+    from API.infrastructure.database.commands import upgrade_schema
+    from API.infrastructure.database.models import Base
+    from API.infrastructure.database.recruiting import BitrixOutbox, ResumeCache, Resumes, Vacancies
+    from API.infrastructure.database.session import SESSION_MAKER, engine
+    from API.infrastructure.utils.bitrix_outbox import BitrixOutboxWorkers
+    from API.infrastructure.utils.hh_resumes import DatabaseResumeStorage
+    from API.infrastructure.utils.hh_tasks import auto_analysis
+    from API.lib.bitrix.base import bitrix_session_pool
+    from API.lib.hh.base import hh_session_pool
+    from API.lib.hh.resume_cache import hh_resume_cache
+    from API.lib.hh.token import TokenState, hh_tokens
+
+    if not args.no_resume_cache:
+        hh_resume_cache.storage = DatabaseResumeStorage(SESSION_MAKER)
+    hh_tokens.state = TokenState(
+        access_token='fake-access-0',
+        refresh_token='fake-refresh-0',
+        expires_at=datetime.datetime.now() + datetime.timedelta(days=1)
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await upgrade_schema(conn)
+
+    bench_vacancies = Vacancies.id.startswith(VACANCY_PREFIX)
+    async with SESSION_MAKER() as session:
+        await session.execute(delete(Vacancies).where(bench_vacancies))
+        # Every run starts with a cold resume cache
+        await session.execute(delete(ResumeCache).where(ResumeCache.resume_id.startswith(RESUME_PREFIX)))
+        session.add_all(
+            Vacancies(
+                id=f"{VACANCY_PREFIX}{number}",
+                vacancies_id=str(900000 + number),
+                salary=250000,
+                deal_id=str(number),
+                is_active=True
+            )
+            for number in range(args.vacancies)
+        )
+        await session.commit()
+        active = await session.scalar(select(func.count()).select_from(Vacancies).where(Vacancies.is_active))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    calls_before = server_calls(base_url)
+    outbox = BitrixOutboxWorkers(SESSION_MAKER)
+    runs = []
+    started = time.perf_counter()
+    try:
+        for _ in range(args.runs):
+            run_started = time.perf_counter()
+            run_calls_before = server_calls(base_url)
+            # The workers send candidates to Bitrix while the intake goes on
+            await outbox.start()
+            stages = await auto_analysis(SESSION_MAKER)
+            intake = time.perf_counter() - run_started
+            await outbox.stop()
+            await outbox.drain()
+            run_calls = server_calls(base_url)
+            runs.append((intake, run_calls.get('negotiations/response', 0)
+                         - run_calls_before.get('negotiations/response', 0)))
+    finally:
+        elapsed = time.perf_counter() - started
+        await outbox.stop()
+        calls_after = server_calls(base_url)
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        tracemalloc.stop()
+
+        async with SESSION_MAKER() as session:
+            accepted = await session.scalar(
+                select(func.count()).select_from(Resumes).join(Vacancies).where(bench_vacancies)
+            )
+            undelivered = await session.scalar(
+                select(func.count()).select_from(BitrixOutbox).join(Vacancies).where(bench_vacancies)
+            )
+            # Negotiations and outbox entries go with their vacancy
+            await session.execute(delete(Resumes).where(Resumes.vacancies_id.startswith(VACANCY_PREFIX)))
+            await session.execute(delete(Vacancies).where(bench_vacancies))
+            await session.execute(delete(ResumeCache).where(ResumeCache.resume_id.startswith(RESUME_PREFIX)))
+            await session.commit()
+        await hh_session_pool.close()
+        await bitrix_session_pool.close()
+        await engine.dispose()
+
+    calls = {
+        name: count - calls_before.get(name, 0)
+        for name, count in calls_after.items()
+        if count != calls_before.get(name, 0)
+    }
+    candidates = active * args.responses
+    total_calls = sum(calls.values())
+    print(
+        f"vacancies={active} candidates={candidates} accepted={accepted} undelivered={undelivered} "
+        f"time={elapsed:.2f}s intake={runs[0][0]:.2f}s"
+    )
+    print(
+        f"vacancies/s={active / elapsed:.2f} "
+        f"candidates/s={candidates / elapsed:.1f} "
+        f"calls/candidate={total_calls / max(candidates, 1):.2f}"
+    )
+    memory = f"peak_rss={peak_rss_mb():.1f}MB"
+    if traced_peak is not None:
+        memory += f" traced_peak={traced_peak / (1024 * 1024):.1f}MB"
+    print(memory)
+    if len(runs) > 1:
+        for number, (run_intake, pages) in enumerate(runs, 1):
+            print(f"run {number}: intake={run_intake:.2f}s response_pages={pages}")
+    for name, count in sorted(calls.items()):
+        print(f"  {name:<32} {count}")
+    for name, stage in stages.items():
+        print(
+            f"stage {name:<8} ok={stage.ok} errors={stage.errors} "
+            f"timeouts={stage.timeouts} busy={stage.busy_seconds:.2f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--vacancies', type=int, default=3)
+    parser.add_argument('--responses', type=int, default=100,
+                        help='negotiations per vacancy')
+    parser.add_argument('--per-page', type=int, default=FakeSettings.per_page)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='server side latency of every call, seconds')
+    parser.add_argument('--pdf-size', type=int, default=FakeSettings.pdf_size)
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of requests answered with 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='share of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=FakeSettings.retry_after)
+    parser.add_argument('--shared-rate', type=float, default=0.3,
+                        help='share of candidates responding to every vacancy')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='HH requests per second, instead of HH_RATE_LIMIT')
+    parser.add_argument('--no-resume-cache', action='store_true',
+                        help='fetch every resume from HH, as without the resume cache')
+    parser.add_argument('--runs', type=int, default=1,
+                        help='auto_analysis runs in a row; the later ones only see new responses')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='also report the peak of traced Python allocations (slower)')
+    args = parser.parse_args()
+
+    process, stop, base_url = start_server(
+        FakeSettings(
+            latency=args.latency,
+            responses_per_vacancy=args.responses,
+            per_page=args.per_page,
+            pdf_size=args.pdf_size,
+            error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate,
+            retry_after=args.retry_after,
+            shared_rate=args.shared_rate
+        )
+    )
+    try:
+        asyncio.run(run(args, base_url))
+    finally:
+        stop.set()
+        process.join(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
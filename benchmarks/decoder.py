@@ -0,0 +1,148 @@
+"""
+Objects per second of the negotiations/response decoding: the previous
+hand-written parser on stdlib json against the compiled decoder.
+
+    python -m benchmarks.decoder --payload recorded_page.json
+
+Without --payload a page of 100 negotiations from the fake server is used.
+"""
+import argparse
+import json
+import time
+import typing
+
+from API.lib.hh.decoder import decode_negotiations, loads
+from API.lib.schemas.resume import Areas, Education, Experience, Gender, Level, Primary, Resume, Salary
+from API.lib.schemas.states import States
+from API.lib.schemas.vacation import Vacation, VacationItems
+from benchmarks.fake_server import make_negotiation
+
+
+def legacy_parse(
+        body: bytes
+) -> VacationItems:
+    """The parser of HeadHunter.get_response before the compiled decoder."""
+    result = json.loads(body)
+    vacations = VacationItems()
+    vacations.found = result.get('found')
+    if result.get('items'):
+        for i in result.get('items'):
+            salary = None
+            gender = None
+            if i.get('resume').get('salary'):
+                salary = Salary()
+                salary.currency = i.get('resume').get('salary').get('currency', None)
+                salary.amount = i.get('resume').get('salary').get('amount', None)
+            if i.get('resume').get('gender'):
+                gender = Gender(
+                    id=i.get('resume').get('gender').get('id', None),
+                    name=i.get('resume').get('gender').get('name', None)
+                )
+            resume = Resume(
+                id=i.get('resume').get('id'),
+                last_name=i.get('resume').get('last_name'),
+                first_name=i.get('resume').get('first_name'),
+                middle_name=i.get('resume').get('middle_name'),
+                title=i.get('resume').get('title'),
+                area=Areas(
+                    id=i.get('resume').get('area').get('id'),
+                    name=i.get('resume').get('area').get('name')
+                ),
+                age=i.get('resume').get('age'),
+                gender=gender,
+                salary=salary,
+                total_experience=i.get('resume').get('total_experience')
+            )
+            vacation = Vacation(
+                id=i.get('id'),
+                state=States(
+                    id=i.get('state').get('id'),
+                    name=i.get('state').get('name')
+                ),
+                created_at=i.get('created_at')
+            )
+            education = Education()
+            if i.get('resume') and i.get('resume').get('education') and i.get('resume').get('education').get('level'):
+                education.level = Level(
+                    id=i.get('resume').get('education').get('level').get('id'),
+                    name=i.get('resume').get('education').get('level').get('name')
+                )
+            if i.get('resume'):
+                if i.get('resume').get('primary'):
+                    education.primary = []
+                    for j in i.get('resume').get('primary'):
+                        education.primary.append(
+                            Primary(
+                                id=j.get('id'),
+                                name=j.get('name')
+                            )
+                        )
+                if i.get('resume').get('experience'):
+                    resume.experience = []
+                    for j in i.get('resume').get('experience'):
+                        e = Experience(
+                            start=j.get('start'),
+                            end=j.get('end'),
+                            company_id=j.get('company_id'),
+                            industry=j.get('industry'),
+                            company=j.get('company'),
+                            company_url=j.get('company_url'),
+                            position=j.get('position')
+                        )
+                        if j.get('area'):
+                            e.area = Areas(
+                                id=j.get('area').get('id'),
+                                name=j.get('area').get('name')
+                            )
+                        resume.experience.append(e)
+            vacation.resume = resume
+            vacations.append_item(vacation)
+    return vacations
+
+
+def benchmark(
+        name: str,
+        parse: typing.Callable[[bytes], VacationItems],
+        body: bytes,
+        seconds: float
+):
+    items = len(parse(body).data)
+    rounds = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        parse(body)
+        rounds += 1
+    elapsed = time.perf_counter() - started
+    print(f"{name:<10} {rounds * items / elapsed:12,.0f} negotiations/s")
+    return rounds * items / elapsed
+
+
+def main(args):
+    if args.payload:
+        with open(args.payload, 'rb') as file:
+            body = file.read()
+    else:
+        body = json.dumps({
+            'found': 100,
+            'pages': 1,
+            'items': [make_negotiation('1', number) for number in range(100)]
+        }).encode()
+
+    legacy = legacy_parse(body).data
+    compiled = decode_negotiations(loads(body)).data
+    for vacation in compiled:
+        # Added for the resume cache, the old parser did not read it
+        if vacation.resume:
+            vacation.resume.updated_at = None
+    print("objects: " + ("same as legacy" if legacy == compiled else "DIFFERENT from legacy"))
+
+    before = benchmark('legacy', legacy_parse, body, args.seconds)
+    after = benchmark('compiled', lambda data: decode_negotiations(loads(data)), body, args.seconds)
+    print(f"speedup x{after / before:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--payload', help='recorded negotiations/response body')
+    parser.add_argument('--seconds', type=float, default=2.0)
+    main(parser.parse_args())
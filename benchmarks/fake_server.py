@@ -0,0 +1,424 @@
+"""
+Local stand-in for the HeadHunter and Bitrix APIs used by the benchmarks.
+
+The server runs in its own thread with its own event loop, so the code
+under test can still make blocking calls (e.g. the OAuth refresh) without
+dead-locking the benchmark. It can also be run on its own:
+
+    python -m benchmarks.fake_server --port 8080 --latency 0.01 --throttle-rate 0.05
+
+and pointed to with HH_API_URL=http://127.0.0.1:8080/{method},
+HH_TOKEN_URL=http://127.0.0.1:8080/oauth/token and
+BITRIX_API_URL=http://127.0.0.1:8080/rest. GET /__stats returns the
+number of calls per endpoint.
+"""
+import argparse
+import asyncio
+import datetime
+import random
+import threading
+import typing
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+# Resume ids of the fake server, so that cached entries can be told apart
+RESUME_PREFIX = 'fake-'
+
+# Negotiation `number` of a vacancy was created `number` minutes later
+FIRST_RESPONSE_AT = datetime.datetime(2025, 1, 1, 10, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=5)))
+
+
+@dataclass
+class FakeSettings:
+    latency: float = 0.005
+    responses_per_vacancy: int = 100
+    per_page: int = 20
+    # Reject requests that do not carry the last issued access token
+    check_auth: bool = False
+    pdf_size: int = 200 * 1024
+    # Share of requests answered with 503 / with 429 and Retry-After
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: float = 1.0
+    seed: int = 0
+    # Share of the responses of a vacancy coming from candidates who also
+    # responded to every other vacancy
+    shared_rate: float = 0.0
+
+
+def make_negotiation(
+        vacancy_id: str,
+        number: int,
+        shared: bool = False
+) -> dict:
+    """Negotiation `number` of a vacancy; a shared resume responds to every vacancy."""
+    negotiation_id = f"{vacancy_id}-{number}"
+    resume_id = f"shared-{number}" if shared else negotiation_id
+    return {
+        'id': f"n{negotiation_id}",
+        'created_at': (FIRST_RESPONSE_AT + datetime.timedelta(minutes=number)).strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'state': {'id': 'response', 'name': 'Отклик'},
+        'resume': {
+            'id': f"{RESUME_PREFIX}{resume_id}",
+            'updated_at': '2025-01-01T09:00:00+0500',
+            'first_name': 'Иван',
+            'last_name': 'Иванов',
+            'middle_name': 'Иванович',
+            'title': 'Продавец-консультант',
+            'age': 25,
+            'area': {'id': '160', 'name': 'Алматы'},
+            'gender': {'id': 'male', 'name': 'Мужской'},
+            # 150 000 - 300 000, so a vacancy accepts only part of the responses
+            'salary': {'amount': 150000 + 50000 * (number % 4), 'currency': 'KZT'},
+            'total_experience': {'months': 30},
+            'education': {'level': {'id': 'higher', 'name': 'Высшее'}},
+            'experience': [
+                {
+                    'start': '2022-01-01',
+                    'end': None,
+                    'company': 'ТОО Ромашка',
+                    'company_id': '1',
+                    'position': 'Продавец',
+                    'area': {'id': '160', 'name': 'Алматы'},
+                    'industry': []
+                }
+            ]
+        }
+    }
+
+
+class FakeHeadHunter:
+
+    def __init__(
+            self,
+            settings: FakeSettings = None
+    ):
+        self.settings = settings or FakeSettings()
+        self.calls: typing.Dict[str, int] = {}
+        self.access_token = 'fake-access-0'
+        self.refresh_token = 'fake-refresh-0'
+        self.issued_tokens = 0
+        self.bitrix_ids = 0
+        self.random = random.Random(self.settings.seed)
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._thread: typing.Optional[threading.Thread] = None
+        self._runner: typing.Optional[web.AppRunner] = None
+        self.base_url: typing.Optional[str] = None
+
+    def _count(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    async def _delay(self):
+        if self.settings.latency:
+            await asyncio.sleep(self.settings.latency)
+
+    def expire_token(self):
+        self.access_token = None
+
+    async def oauth_token(self, request: web.Request) -> web.Response:
+        self._count('oauth/token')
+        await self._delay()
+        if self.access_token is not None or request.query.get('refresh_token') != self.refresh_token:
+            return web.json_response(
+                {'error': 'invalid_grant', 'error_description': 'token not expired'},
+                status=400
+            )
+        self.issued_tokens += 1
+        self.access_token = f'fake-access-{self.issued_tokens}'
+        self.refresh_token = f'fake-refresh-{self.issued_tokens}'
+        return web.json_response({
+            'access_token': self.access_token,
+            'token_type': 'bearer',
+            'refresh_token': self.refresh_token,
+            'expires_in': 1209600
+        })
+
+    @web.middleware
+    async def fault_middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        if request.path in ('/oauth/token', '/__stats'):
+            return await handler(request)
+        if self.settings.throttle_rate and self.random.random() < self.settings.throttle_rate:
+            self._count('throttled')
+            return web.json_response(
+                {'errors': [{'type': 'too_many_requests'}]},
+                status=429,
+                headers={'Retry-After': str(self.settings.retry_after)}
+            )
+        if self.settings.error_rate and self.random.random() < self.settings.error_rate:
+            self._count('errors')
+            await self._delay()
+            return web.json_response({'errors': [{'type': 'service_unavailable'}]}, status=503)
+        return await handler(request)
+
+    @web.middleware
+    async def auth_middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        # Bitrix webhooks carry their token in the path
+        if self.settings.check_auth and not request.path.startswith(('/oauth/token', '/rest/', '/__stats')):
+            if request.headers.get('Authorization') != f'Bearer {self.access_token}':
+                self._count('unauthorized')
+                return web.json_response(
+                    {'errors': [{'type': 'oauth', 'value': 'token_expired'}]},
+                    status=403
+                )
+        return await handler(request)
+
+    async def negotiations_response(self, request: web.Request) -> web.Response:
+        self._count('negotiations/response')
+        await self._delay()
+        vacancy_id = request.query.get('vacancy_id', '0')
+        page = int(request.query.get('page', 0))
+        per_page = min(int(request.query.get('per_page', self.settings.per_page)), 100)
+        found = self.settings.responses_per_vacancy
+        start = page * per_page
+        numbers = range(start, min(start + per_page, found))
+        if request.query.get('order_by') == 'created_at' and request.query.get('order') == 'desc':
+            # Newest first
+            numbers = [found - 1 - number for number in numbers]
+        items = [
+            make_negotiation(vacancy_id, number, shared=number % 100 < self.settings.shared_rate * 100)
+            for number in numbers
+        ]
+        return web.json_response({
+            'found': found,
+            'page': page,
+            'per_page': per_page,
+            'pages': (found + per_page - 1) // per_page,
+            'items': items
+        })
+
+    async def dictionaries(self, request: web.Request) -> web.Response:
+        self._count('dictionaries')
+        await self._delay()
+        etag = '"dictionaries-1"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        keys = ('work_format', 'work_schedule_by_days', 'working_hours', 'vacancy_billing_type',
+                'vacancy_type', 'employment_form', 'experience')
+        body = {
+            key: [{'id': f'{key}-{number}', 'name': f'{key} {number}'} for number in range(10)]
+            for key in keys
+        }
+        return web.json_response(body, headers={'ETag': etag})
+
+    async def resume(self, request: web.Request) -> web.Response:
+        self._count('resumes')
+        await self._delay()
+        resume_id = request.match_info['resume_id']
+        return web.json_response({
+            'id': resume_id,
+            'birth_date': '1999-01-01',
+            'contact': [
+                {'type': {'id': 'cell'}, 'value': {'country': '7', 'city': '701', 'number': '1234567'}},
+                {'type': {'id': 'email'}, 'value': f'{resume_id}@example.com'}
+            ],
+            'actions': {
+                'download': {
+                    'pdf': {'url': f'{self.base_url}/resumes/{resume_id}/download.pdf'}
+                }
+            }
+        })
+
+    async def resume_pdf(self, request: web.Request) -> web.StreamResponse:
+        self._count('resumes/pdf')
+        await self._delay()
+        resume_id = request.match_info['resume_id'].encode()
+        response = web.StreamResponse(headers={'Content-Type': 'application/pdf'})
+        response.content_length = self.settings.pdf_size
+        await response.prepare(request)
+        chunk = (b'%PDF-' + resume_id + b'\n') * 1024
+        left = self.settings.pdf_size
+        while left > 0:
+            part = chunk[:left]
+            await response.write(part)
+            left -= len(part)
+        await response.write_eof()
+        return response
+
+    async def negotiation_message(self, request: web.Request) -> web.Response:
+        self._count('negotiations/messages')
+        await self._delay()
+        await request.post()
+        return web.json_response({'id': request.match_info['nid']}, status=201)
+
+    async def negotiation_action(self, request: web.Request) -> web.Response:
+        self._count(f"negotiations/{request.match_info['state']}")
+        await self._delay()
+        # The letter to the candidate may come with the state change
+        await request.post()
+        return web.Response(status=204)
+
+    def _bitrix_result(self, method: str):
+        self.bitrix_ids += 1
+        if method == 'crm.item.add':
+            return {'item': {'id': self.bitrix_ids}}
+        return self.bitrix_ids
+
+    async def bitrix(self, request: web.Request) -> web.Response:
+        method = request.match_info['method'].removesuffix('.json')
+        self._count(f'bitrix/{method}')
+        await self._delay()
+        if request.can_read_body:
+            await request.read()
+        if method == 'batch':
+            commands = (await request.json()).get('cmd', {})
+            return web.json_response({
+                'result': {
+                    'result': {
+                        key: self._bitrix_result(command.split('?', 1)[0])
+                        for key, command in commands.items()
+                    },
+                    'result_error': [],
+                    'result_total': [],
+                    'result_next': [],
+                    'result_time': {}
+                },
+                'time': {}
+            })
+        if method not in ('crm.contact.add', 'crm.item.add', 'crm.lead.add'):
+            return web.json_response(
+                {'error': 'ERROR_METHOD_NOT_FOUND', 'error_description': 'Method not found!'},
+                status=404
+            )
+        return web.json_response({'result': self._bitrix_result(method), 'time': {}})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.calls)
+
+    def reference(self, name: str, body) -> typing.Callable:
+        async def handler(request: web.Request) -> web.Response:
+            self._count(name)
+            await self._delay()
+            return web.json_response(body)
+        return handler
+
+    def make_app(self) -> web.Application:
+        app = web.Application(
+            middlewares=[self.fault_middleware, self.auth_middleware],
+            # Bitrix batches carry the PDFs of several candidates
+            client_max_size=256 * 1024 * 1024
+        )
+        app.router.add_get('/__stats', self.stats)
+        app.router.add_post('/oauth/token', self.oauth_token)
+        app.router.add_get('/negotiations/response', self.negotiations_response)
+        app.router.add_get('/dictionaries', self.dictionaries)
+        app.router.add_get('/resumes/{resume_id}', self.resume)
+        app.router.add_get('/resumes/{resume_id}/download.pdf', self.resume_pdf)
+        app.router.add_post('/negotiations/{nid}/messages', self.negotiation_message)
+        app.router.add_put('/negotiations/{state}/{nid}', self.negotiation_action)
+        app.router.add_post('/rest/{user_id}/{token}/{method}', self.bitrix)
+        employer = '/employers/{employer_id}'
+        app.router.add_get('/professional_roles', self.reference('professional_roles', {
+            'categories': [{'id': '27', 'name': 'Продажи', 'roles': [{'id': '40', 'name': 'Продавец'}]}]
+        }))
+        app.router.add_get(f'{employer}/vacancy_branded_templates', self.reference('templates', {
+            'items': [{'id': 'makeup:41365', 'name': 'Шаблон'}]
+        }))
+        app.router.add_get(f'{employer}/addresses', self.reference('addresses', {
+            'items': [{'id': '14810227', 'city': 'Алматы', 'raw': 'Алматы, улица Абдуллы Розыбакиева, 247А'}]
+        }))
+        app.router.add_get(f'{employer}/managers', self.reference('managers', {
+            'items': [{'id': '11882099', 'first_name': 'Акмарал', 'last_name': 'Дюсембаева',
+                       'area': {'id': '160', 'name': 'Алматы'}}]
+        }))
+        app.router.add_get('/areas', self.reference('areas', [
+            {'id': '40', 'name': 'Казахстан', 'areas': [{'id': '160', 'parent_id': '40', 'name': 'Алматы'}]}
+        ]))
+        return app
+
+    async def _start(self, host: str, port: int):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+
+    def start(
+            self,
+            host: str = '127.0.0.1',
+            port: int = 0
+    ) -> str:
+        """Start the server in a background thread and return its base url."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._start(host, port))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop)
+        future.result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+
+def serve(
+        settings: FakeSettings,
+        host: str,
+        port: int,
+        urls=None,
+        stop: typing.Optional[threading.Event] = None
+):
+    """Run the server until `stop` is set, e.g. in a child process.
+
+    The base url is put into the `urls` queue once the server listens.
+    """
+    server = FakeHeadHunter(settings)
+    base_url = server.start(host, port)
+    if urls is not None:
+        urls.put(base_url)
+    try:
+        if stop is not None:
+            stop.wait()
+        else:
+            threading.Event().wait()
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=FakeSettings.latency)
+    parser.add_argument('--responses', type=int, default=FakeSettings.responses_per_vacancy,
+                        help='negotiations per vacancy')
+    parser.add_argument('--per-page', type=int, default=FakeSettings.per_page)
+    parser.add_argument('--pdf-size', type=int, default=FakeSettings.pdf_size)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=FakeSettings.retry_after)
+    parser.add_argument('--shared-rate', type=float, default=0.0,
+                        help='share of candidates responding to every vacancy')
+    args = parser.parse_args()
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        serve(
+            FakeSettings(
+                latency=args.latency,
+                responses_per_vacancy=args.responses,
+                per_page=args.per_page,
+                pdf_size=args.pdf_size,
+                error_rate=args.error_rate,
+                throttle_rate=args.throttle_rate,
+                retry_after=args.retry_after,
+                shared_rate=args.shared_rate
+            ),
+            args.host,
+            args.port
+        )
+    except KeyboardInterrupt:
+        pass
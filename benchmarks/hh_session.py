@@ -0,0 +1,91 @@
+"""
+Per-call latency and total run time of HeadHunter requests:
+a new aiohttp.ClientSession per call (the old behaviour of
+BaseApi.request_session) against the shared SessionPool.
+
+    python -m benchmarks.hh_session --calls 500 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import typing
+
+import aiohttp
+
+from API.lib.session import SessionPool
+from benchmarks.fake_server import FakeHeadHunter, FakeSettings
+
+
+async def call_per_session(url: str, params: dict) -> float:
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, params=params) as response:
+            json.loads(await response.read())
+    return time.perf_counter() - started
+
+
+def call_pooled(pool: SessionPool) -> typing.Callable:
+    async def call(url: str, params: dict) -> float:
+        started = time.perf_counter()
+        session = await pool.get()
+        async with session.get(url, params=params) as response:
+            json.loads(await response.read())
+        return time.perf_counter() - started
+    return call
+
+
+async def run(
+        call: typing.Callable,
+        url: str,
+        calls: int,
+        concurrency: int
+) -> typing.Tuple[typing.List[float], float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(page: int) -> float:
+        async with semaphore:
+            return await call(url, {'vacancy_id': '1', 'page': page % 5})
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(one(p) for p in range(calls)))
+    return list(latencies), time.perf_counter() - started
+
+
+def report(name: str, latencies: typing.List[float], total: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<12} calls={len(latencies):<5} "
+        f"p50={statistics.median(latencies) * 1000:7.2f}ms "
+        f"p95={p95 * 1000:7.2f}ms "
+        f"mean={statistics.fmean(latencies) * 1000:7.2f}ms "
+        f"total={total:6.2f}s"
+    )
+
+
+async def main(args):
+    server = FakeHeadHunter(FakeSettings(latency=args.latency))
+    base_url = server.start()
+    url = f"{base_url}/negotiations/response"
+    pool = SessionPool('bench')
+    try:
+        for concurrency in (1, args.concurrency):
+            print(f"-- concurrency {concurrency}")
+            latencies, total = await run(call_per_session, url, args.calls, concurrency)
+            report('per-call', latencies, total)
+            latencies, total = await run(call_pooled(pool), url, args.calls, concurrency)
+            report('pooled', latencies, total)
+    finally:
+        await pool.close()
+        server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='server side latency of every call, seconds')
+    asyncio.run(main(parser.parse_args()))